@@ -0,0 +1,111 @@
+# backend/fastapi-ai/app/config.py
+"""
+Runtime settings for the recommendation service.
+Every value can be overridden with an environment variable of the same name.
+"""
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    val = os.getenv(name)
+    if val is None:
+        return default
+    return val.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Storage dtype of the L2-normalized embedding matrix held in memory:
+# "float32" (default) or "float16" (half the memory, scores upcast per block).
+EMBEDDINGS_DTYPE = os.getenv("EMBEDDINGS_DTYPE", "float32").lower()
+
+# Serve the normalized matrix from a memory-mapped .npy cache next to
+# embeddings.npy, so every uvicorn worker shares one page-cache copy and
+# pages are only read when touched. Set to 0 to load it into process memory.
+EMBEDDINGS_MMAP = _env_bool("EMBEDDINGS_MMAP", True)
+
+# Which nearest-neighbour backend recommend_similar should use:
+#   "brute"   exact dot-product search over the embedding matrix (no artifact needed)
+#   "ivf"     inverted-file index built by data/scripts/build_index_and_clusters.py
+#   "hnsw"    FAISS HNSW graph (requires faiss-cpu)
+#   "sklearn" legacy pickled sklearn NearestNeighbors (nn_index.pkl)
+ANN_BACKEND = os.getenv("ANN_BACKEND", "brute").lower()
+
+# Number of inverted lists scanned per query by the "ivf" backend.
+ANN_NPROBE = _env_int("ANN_NPROBE", 8)
+
+# Cluster-routed search with the KMeans model from build_index_and_clusters.py:
+# when > 0, recommend_similar probes the CLUSTER_NPROBE clusters closest to the
+# query and scores only their members (overrides ANN_BACKEND). 0 disables it.
+CLUSTER_NPROBE = _env_int("CLUSTER_NPROBE", 0)
+
+# Size of the dynamic candidate list used by the "hnsw" backend at query time.
+ANN_EF_SEARCH = _env_int("ANN_EF_SEARCH", 64)
+
+# /similar?color_weight=w blends color similarity (color_index.npy) into the
+# visual score for the top_k * COLOR_RERANK_FACTOR nearest visual neighbours.
+COLOR_RERANK_FACTOR = _env_int("COLOR_RERANK_FACTOR", 10)
+
+# Serve /similar for catalog items from the precomputed top-K neighbour table
+# (build_index_and_clusters.py --neighbors K) when it exists and matches the
+# embeddings; requests for more than K neighbours still search live.
+NEIGHBOR_TABLE_ENABLED = _env_bool("NEIGHBOR_TABLE_ENABLED", True)
+
+# URL path the processed images are served under (StaticFiles mount in main.py).
+STATIC_IMAGES_PATH = "/static/images"
+
+# Maximum number of product ids accepted by POST /similar:batch.
+SIMILAR_BATCH_MAX_IDS = _env_int("SIMILAR_BATCH_MAX_IDS", 200)
+
+# Upper bound on top_k (and similar:batch top_k_by_id values) for every
+# endpoint; larger requests are rejected with 422.
+RECO_MAX_TOP_K = _env_int("RECO_MAX_TOP_K", 100)
+
+# Bounded executor for recommender calls (see utils/executor.py).
+# RECO_WORKERS threads run requests; up to RECO_MAX_QUEUE more may wait before
+# new requests get 503 with Retry-After: RECO_RETRY_AFTER_S.
+RECO_WORKERS = _env_int("RECO_WORKERS", min(4, os.cpu_count() or 1))
+RECO_MAX_QUEUE = _env_int("RECO_MAX_QUEUE", 32)
+RECO_RETRY_AFTER_S = _env_int("RECO_RETRY_AFTER_S", 1)
+# Per-request deadline in milliseconds (0 disables it); late requests get 504.
+RECO_DEADLINE_MS = _env_int("RECO_DEADLINE_MS", 2000)
+# BLAS threads per process; 0 means cpu_count // RECO_WORKERS so that request
+# threads and BLAS threads together do not oversubscribe the cores.
+RECO_BLAS_THREADS = _env_int("RECO_BLAS_THREADS", 0)
+
+# In-process result cache for /similar and /by-quiz (see utils/cache.TTLCache).
+# Set either value to 0 to disable caching.
+RESULT_CACHE_MAX_BYTES = _env_int("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+RESULT_CACHE_TTL_S = _env_int("RESULT_CACHE_TTL_S", 600)
+
+# Hot reload (see services/reloader.py). The admin endpoints require ADMIN_TOKEN
+# in the X-Admin-Token header and answer 404 while it is unset.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# Poll artifact files every N seconds and reload on change; 0 disables the watcher.
+ARTIFACT_WATCH_INTERVAL_S = _env_int("ARTIFACT_WATCH_INTERVAL_S", 0)
+
+# Build the catalog's image model (see the embeddings manifest) and run a dummy
+# inference in a background thread at startup (services/embedding.warm_up), so
+# the first image request doesn't pay for framework import and model build.
+EMBEDDING_WARMUP = _env_bool("EMBEDDING_WARMUP", False)
+
+# POST /by-image: uploads are embedded in micro-batches (see utils/batcher.py).
+# A batch runs when it has IMAGE_BATCH_MAX_SIZE images or IMAGE_BATCH_MAX_WAIT_MS
+# after its first image arrived; beyond IMAGE_MAX_QUEUE waiting images new
+# uploads get 503. IMAGE_DEADLINE_MS bounds the whole request, decode, embedding
+# and catalog search together (0 disables it); the search stage is additionally
+# capped by RECO_DEADLINE_MS.
+IMAGE_BATCH_MAX_SIZE = _env_int("IMAGE_BATCH_MAX_SIZE", 16)
+IMAGE_BATCH_MAX_WAIT_MS = _env_int("IMAGE_BATCH_MAX_WAIT_MS", 10)
+IMAGE_MAX_QUEUE = _env_int("IMAGE_MAX_QUEUE", 64)
+IMAGE_DEADLINE_MS = _env_int("IMAGE_DEADLINE_MS", 10000)
+IMAGE_MAX_UPLOAD_BYTES = _env_int("IMAGE_MAX_UPLOAD_BYTES", 10 * 1024 * 1024)
+
+# Per-stage latency histograms and cache/queue gauges, served in the Prometheus
+# text format at GET /metrics (see utils/metrics.py). Cheap enough to leave on.
+METRICS_ENABLED = _env_bool("METRICS_ENABLED", True)
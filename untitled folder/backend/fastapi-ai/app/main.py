@@ -4,9 +4,12 @@ import logging
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from fastapi.staticfiles import StaticFiles
 
+from . import config  # relative import
 from .routes import recommend  # relative import
+from .utils import metrics  # relative import
 
 logger = logging.getLogger("uvicorn")
 logger.setLevel(logging.INFO)
@@ -29,8 +32,8 @@ IMAGES_DIR = PROJECT_ROOT / "data" / "processed" / "images"
 
 if IMAGES_DIR.exists():
     # mount static files at /static/images
-    app.mount("/static/images", StaticFiles(directory=str(IMAGES_DIR)), name="images")
-    logger.info(f"Mounted static images directory at /static/images -> {IMAGES_DIR}")
+    app.mount(config.STATIC_IMAGES_PATH, StaticFiles(directory=str(IMAGES_DIR)), name="images")
+    logger.info(f"Mounted static images directory at {config.STATIC_IMAGES_PATH} -> {IMAGES_DIR}")
 else:
     logger.warning(f"Images directory not found, static mount skipped: {IMAGES_DIR}")
 
@@ -43,6 +46,13 @@ def root():
     return {"status": "ok", "service": "fashion-recommendation-ai"}
 
 
+if config.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    def get_metrics():
+        """Stage latency histograms and cache/queue gauges for Prometheus (see utils/metrics.py)."""
+        return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 def image_url_for(request: Request, image_filename: str) -> str:
     """
     Helper to produce a full URL for a mounted static image.
@@ -1,6 +1,11 @@
 # backend/fastapi-ai/app/models/schemas.py
-from pydantic import BaseModel, Field
-from typing import List, Optional, Any
+from pydantic import BaseModel, Field, conint
+from typing import Dict, List, Optional, Any
+
+from .. import config  # relative import
+
+# number of results per query: 1..RECO_MAX_TOP_K
+TopK = conint(ge=1, le=config.RECO_MAX_TOP_K)
 
 class SimilarItem(BaseModel):
     id: str
@@ -12,12 +17,28 @@ class SimilarResponse(BaseModel):
     query_id: str
     results: List[SimilarItem]
 
+class SimilarBatchRequest(BaseModel):
+    product_ids: List[str] = Field(..., description="Product ids to find similar items for")
+    top_k: Optional[TopK] = Field(10, description="Default number of results per id")
+    top_k_by_id: Optional[Dict[str, TopK]] = Field(None, description="Optional per-id override of top_k")
+
+class SimilarBatchResponse(BaseModel):
+    results: Dict[str, List[SimilarItem]]
+
 class QuizRequest(BaseModel):
     answers: List[str] = Field(..., description="List of quiz answer texts")
     gender: Optional[str] = Field(None, description="Optional: 'Male' or 'Female' or 'Other'")
-    top_k: Optional[int] = Field(10, description="Number of results to return")
+    top_k: Optional[TopK] = Field(10, description="Number of results to return")
+    filters: Optional[Dict[str, List[str]]] = Field(
+        None,
+        description="Optional attribute filters, e.g. {'articleType': ['Shirts'], 'season': ['Summer']}. "
+                    "Supported: gender, masterCategory, articleType, baseColour, season, usage"
+    )
 
 class QuizResponse(BaseModel):
     results: List[SimilarItem]
     used_text_candidates: int
     used_visual_candidates: int
+    filters_relaxed: bool = Field(
+        False, description="True if no item matched all filters, so only gender or no filter was applied"
+    )
@@ -1,36 +1,146 @@
 # backend/fastapi-ai/app/routes/recommend.py
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, File, Form, Header, HTTPException, Query, Request, UploadFile
+import hmac
 import logging
 from pathlib import Path
-from typing import List
+import time
+from typing import List, Optional, Tuple
 
-from ..models.schemas import SimilarResponse, SimilarItem, QuizRequest, QuizResponse  # relative import
-from ..services import recommender  # relative import
-from ..utils import loader  # relative import
+from ..models.schemas import (  # relative import
+    SimilarResponse, SimilarItem, SimilarBatchRequest, SimilarBatchResponse, QuizRequest, QuizResponse
+)
+from .. import config  # relative import
+from ..services import embedding, recommender  # relative import
+from ..services.reloader import reloader  # relative import
+from ..utils import loader, metrics  # relative import
+from ..utils.batcher import MicroBatcher  # relative import
+from ..utils.executor import DeadlineExceeded, Overloaded, make_pool  # relative import
+from ..utils.responses import FastJSONResponse  # relative import
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# CPU-bound recommender work runs here, not on Starlette's default threadpool
+pool = make_pool(config.RECO_WORKERS, config.RECO_MAX_QUEUE, config.RECO_BLAS_THREADS)
+# uploaded images for /by-image are embedded together in micro-batches
+def _embed_uploads(images, model):
+    # the model each upload was decoded for (the live catalog's when the request
+    # arrived); uploads for different models are batched separately
+    return embedding.get_extractor(model).embed_batch(images)
+
+
+image_batcher = MicroBatcher(_embed_uploads, config.IMAGE_BATCH_MAX_SIZE, config.IMAGE_BATCH_MAX_WAIT_MS,
+                             config.IMAGE_MAX_QUEUE, name="image-batcher")
+
+
+def _bundle_info():
+    b = recommender.BUNDLE
+    return None if b is None else {"version": b.version, "items": len(b.ids), "loaded_at": b.loaded_at}
+
+
+# state gauges for GET /metrics; read at scrape time only
+metrics.gauge("reco_artifact_load_seconds", "Duration of each artifact load phase at the last (re)load",
+              lambda: dict(loader.LOAD_TIMINGS), labelname="phase")
+metrics.gauge("reco_embedding_warmup_seconds", "Duration of each image model warm-up phase",
+              lambda: dict(embedding.WARMUP_TIMINGS), labelname="phase")
+metrics.gauge("reco_bundle_version", "Version of the live artifact bundle",
+              lambda: (_bundle_info() or {}).get("version"))
+metrics.gauge("reco_bundle_items", "Catalog items in the live artifact bundle",
+              lambda: (_bundle_info() or {}).get("items"))
+metrics.gauge("reco_bundle_loaded_timestamp_seconds", "Unix time the live artifact bundle was built",
+              lambda: (_bundle_info() or {}).get("loaded_at"))
+metrics.gauge("reco_result_cache_entries", "Entries in the result cache",
+              lambda: recommender.RESULT_CACHE.stats()["entries"])
+metrics.gauge("reco_result_cache_bytes", "Approximate size of the result cache",
+              lambda: recommender.RESULT_CACHE.stats()["bytes"])
+metrics.counter("reco_result_cache_requests_total", "Result cache lookups by outcome",
+                lambda: {k: recommender.RESULT_CACHE.stats()[k] for k in ("hits", "misses")},
+                labelname="result")
+metrics.counter("reco_result_cache_evictions_total", "Entries evicted from the result cache",
+                lambda: recommender.RESULT_CACHE.stats()["evictions"])
+metrics.gauge("reco_pool_pending", "Recommender pool tasks queued or running", lambda: pool.pending)
+metrics.gauge("reco_pool_queued", "Recommender pool tasks waiting for a thread", lambda: pool.queued)
+metrics.counter("reco_pool_rejected_total", "Requests shed because the pool queue was full",
+                lambda: pool.rejected)
+metrics.counter("reco_pool_timed_out_total", "Requests that missed their deadline on the pool",
+                lambda: pool.timed_out)
+metrics.gauge("reco_image_batcher_queued", "Uploads waiting to be embedded",
+              lambda: image_batcher.stats()["queued"])
+metrics.counter("reco_image_batcher_batches_total", "Embedding batches run", lambda: image_batcher.batches)
+metrics.counter("reco_image_batcher_items_total", "Uploads embedded", lambda: image_batcher.items)
+metrics.counter("reco_image_batcher_rejected_total", "Uploads shed because the batch queue was full",
+                lambda: image_batcher.rejected)
+metrics.counter("reco_image_batcher_timed_out_total", "Uploads that missed their deadline in the batch queue",
+                lambda: image_batcher.timed_out)
+
 
 @router.on_event("startup")
 def startup_event():
-    metadata_df = loader.load_metadata()
-    embeddings = loader.load_embeddings()
-    index_df = loader.load_index_map()
-    nn = loader.load_nn_index()
-    kmeans = loader.load_kmeans()
-    vectorizer, tfidf = loader.build_text_matrix(metadata_df)
-
-    resources = {
-        "embeddings": embeddings,
-        "index_df": index_df,
-        "nn": nn,
-        "kmeans": kmeans,
-        "vectorizer": vectorizer,
-        "tfidf": tfidf,
-    }
-    recommender.init(resources)
-    logger.info("Recommender initialized on startup.")
+    with loader.timed("startup_total"):
+        resources = loader.load_resources()
+        with loader.timed("build_bundle"):
+            recommender.init(resources)
+        reloader.mark_loaded()
+        reloader.start_watching(config.ARTIFACT_WATCH_INTERVAL_S)
+        pool.start()
+    if config.EMBEDDING_WARMUP and recommender.image_model():
+        # builds the image model off the request path; startup doesn't wait for it
+        embedding.warm_up_in_background(recommender.image_model())
+    logger.info("Recommender initialized on startup: " +
+                " ".join(f"{k}={v:.3f}s" for k, v in loader.LOAD_TIMINGS.items()))
+
+
+@router.on_event("shutdown")
+def shutdown_event():
+    reloader.stop_watching()
+    image_batcher.shutdown()
+    pool.shutdown()
+
+
+async def _run(fn, budget_s: Optional[float] = None, **kwargs):
+    """
+    Run a recommender call on the bounded pool with the configured deadline,
+    or within budget_s seconds (what is left of a longer request) if sooner.
+    """
+    deadline_s = config.RECO_DEADLINE_MS / 1000.0 if config.RECO_DEADLINE_MS > 0 else None
+    if budget_s is not None:
+        deadline_s = min(deadline_s, budget_s) if deadline_s is not None else budget_s
+    return await pool.run(fn, deadline_s=deadline_s, **kwargs)
+
+
+def _budget(total_ms: int):
+    """
+    remaining() for a request-wide deadline of total_ms (0 = none): the seconds
+    left for the next stage, None without a deadline; raises DeadlineExceeded
+    once the budget is spent.
+    """
+    expires = time.monotonic() + total_ms / 1000.0 if total_ms > 0 else None
+
+    def remaining() -> Optional[float]:
+        if expires is None:
+            return None
+        left = expires - time.monotonic()
+        if left <= 0:
+            raise DeadlineExceeded()
+        return left
+    return remaining
+
+
+async def _cached(key, fn, **kwargs):
+    """Return a cached recommender result for key, computing it on the pool on a miss."""
+    cache = recommender.RESULT_CACHE
+    result = cache.get(key)
+    if result is None:
+        result = await _run(fn, **kwargs)
+        cache.set(key, result)
+    return result
+
+
+def _busy_error(e: Exception) -> HTTPException:
+    if isinstance(e, Overloaded):
+        return HTTPException(status_code=503, detail="Recommender is overloaded, retry later",
+                             headers={"Retry-After": str(config.RECO_RETRY_AFTER_S)})
+    return HTTPException(status_code=504, detail="Recommendation deadline exceeded")
 
 
 def _build_image_url_safe(request: Request, local_image_path: str) -> str:
@@ -60,9 +170,17 @@ def _build_image_url_safe(request: Request, local_image_path: str) -> str:
 
 
 @router.get("/similar/{product_id}", response_model=SimilarResponse)
-def get_similar(product_id: str, request: Request, top_k: int = 10):
+async def get_similar(product_id: str, request: Request,
+                      top_k: int = Query(10, ge=1, le=config.RECO_MAX_TOP_K), color_weight: float = 0.0):
+    if not 0.0 <= color_weight <= 1.0:
+        raise HTTPException(status_code=400, detail="color_weight must be between 0 and 1")
+    t = metrics.StageTimer("similar_request")
     try:
-        results = recommender.recommend_similar(product_id=product_id, top_k=top_k)
+        results = await _cached(
+            recommender.similar_cache_key(product_id, top_k, color_weight),
+            recommender.recommend_similar, product_id=product_id, top_k=top_k, color_weight=color_weight
+        )
+        t.lap("compute")
         items: List[SimilarItem] = []
         for r in results:
             local_path = r.get("image_path", "") or ""
@@ -74,37 +192,213 @@ def get_similar(product_id: str, request: Request, top_k: int = 10):
                     score=r.get("score", 0.0)
                 )
             )
-        return SimilarResponse(query_id=product_id, results=items)
+        response = SimilarResponse(query_id=product_id, results=items)
+        t.lap("response")
+        metrics.REQUEST_SECONDS.observe(t.total(), "similar")
+        return response
+    except (Overloaded, DeadlineExceeded) as e:
+        raise _busy_error(e)
     except Exception as e:
         logger.exception("Error in get_similar")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/by-quiz", response_model=QuizResponse)
-def post_by_quiz(req: QuizRequest, request: Request):
+@router.post("/similar:batch", response_model=SimilarBatchResponse)
+async def post_similar_batch(req: SimilarBatchRequest, request: Request):
+    if len(req.product_ids) > config.SIMILAR_BATCH_MAX_IDS:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {config.SIMILAR_BATCH_MAX_IDS} product_ids per batch")
+    t = metrics.StageTimer("similar_batch_request")
     try:
-        out = recommender.recommend_by_quiz(
-            answers=req.answers,
-            gender=req.gender,
-            top_k=req.top_k or 10
-        )
-        items: List[SimilarItem] = []
-        for r in out.get("results", []):
-            local_path = r.get("image_path", "") or ""
-            image_url = _build_image_url_safe(request, local_path)
-            items.append(
+        top_k = req.top_k or 10
+        top_k_by_id = req.top_k_by_id or {}
+        cache = recommender.RESULT_CACHE
+        # keys carry the index version seen before computing, so rows computed
+        # against a bundle that was swapped out meanwhile expire with it
+        keys = {pid: recommender.similar_cache_key(pid, top_k_by_id.get(pid, top_k))
+                for pid in dict.fromkeys(req.product_ids)}
+        out = {}
+        misses = []
+        for pid, key in keys.items():
+            out[pid] = cache.get(key)
+            if out[pid] is None:
+                misses.append(pid)
+        if misses:
+            computed = await _run(
+                recommender.recommend_similar_batch,
+                product_ids=misses,
+                top_k=top_k,
+                top_k_by_id=top_k_by_id
+            )
+            for pid, rows in computed.items():
+                cache.set(keys[pid], rows)
+                out[pid] = rows
+        t.lap("compute")
+        results = {}
+        for pid, rows in out.items():
+            results[pid] = [
                 SimilarItem(
                     id=r["id"],
-                    image_path=image_url,
-                    score=r.get("score", 0.0),
-                    metadata=r.get("metadata")
+                    image_path=_build_image_url_safe(request, r.get("image_path", "") or ""),
+                    score=r.get("score", 0.0)
                 )
-            )
-        return QuizResponse(
-            results=items,
-            used_text_candidates=out.get("used_text_candidates", 0),
-            used_visual_candidates=out.get("used_visual_candidates", 0)
+                for r in rows
+            ]
+        response = SimilarBatchResponse(results=results)
+        t.lap("response")
+        metrics.REQUEST_SECONDS.observe(t.total(), "similar_batch")
+        return response
+    except (Overloaded, DeadlineExceeded) as e:
+        raise _busy_error(e)
+    except Exception as e:
+        logger.exception("Error in post_similar_batch")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """'id,score,articleType' -> ('id', 'score', 'articleType'); None keeps the full item shape."""
+    if not fields:
+        return None
+    selected = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in selected if f not in recommender.RESULT_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields {unknown}; "
+                                                    f"choose from {list(recommender.RESULT_FIELDS)}")
+    return selected
+
+
+def _shape_item(r: dict, base_url: str, fields: Optional[Tuple[str, ...]]) -> dict:
+    """One result in the SimilarItem shape (or only the selected fields), built from a full row."""
+    url = f"{base_url}{r['url']}" if r.get("url") else ""
+    if fields is None:
+        return {"id": r["id"], "image_path": url, "score": r.get("score", 0.0), "metadata": r.get("metadata")}
+    item = {}
+    for f in fields:
+        if f == "image_path":
+            item[f] = url
+        elif f in ("id", "score", "metadata"):
+            item[f] = r.get(f)
+        else:
+            item[f] = r.get("attributes", {}).get(f, "")
+    return item
+
+
+@router.post(
+    "/by-quiz",
+    response_class=FastJSONResponse,  # rows are shaped here, not by a response_model
+    responses={200: {
+        "model": QuizResponse,
+        "description": "QuizResponse. With ?fields=..., each result holds only the listed fields "
+                       f"(any of {', '.join(recommender.RESULT_FIELDS)}).",
+    }},
+)
+async def post_by_quiz(req: QuizRequest, request: Request,
+                       fields: Optional[str] = Query(None, description="Comma-separated result fields to keep, "
+                                                                       "e.g. id,score,articleType")):
+    """
+    Quiz recommendations. `fields` (query, e.g. fields=id,score,articleType)
+    limits each result to the listed fields; see recommender.RESULT_FIELDS.
+    """
+    selected = _parse_fields(fields)
+    t = metrics.StageTimer("by_quiz_request")
+    try:
+        top_k = req.top_k or 10
+        out = await _cached(
+            recommender.quiz_cache_key(req.answers, req.gender, top_k, req.filters),
+            recommender.recommend_by_quiz,
+            answers=req.answers,
+            gender=req.gender,
+            top_k=top_k,
+            filters=req.filters
         )
+        t.lap("compute")
+        # rows carry precomputed URL paths; only the host part is per request
+        base_url = str(request.base_url).rstrip("/")
+        response = FastJSONResponse({
+            "results": [_shape_item(r, base_url, selected) for r in out.get("results", [])],
+            "used_text_candidates": out.get("used_text_candidates", 0),
+            "used_visual_candidates": out.get("used_visual_candidates", 0),
+            "filters_relaxed": out.get("filters_relaxed", False),
+        })
+        t.lap("response")
+        metrics.REQUEST_SECONDS.observe(t.total(), "by_quiz")
+        return response
+    except (Overloaded, DeadlineExceeded) as e:
+        raise _busy_error(e)
     except Exception as e:
         logger.exception("Error in post_by_quiz")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/by-image", response_model=SimilarResponse)
+async def post_by_image(request: Request, file: UploadFile = File(...),
+                        top_k: int = Form(10, ge=1, le=config.RECO_MAX_TOP_K)):
+    """Embed an uploaded photo and return the most visually similar catalog items."""
+    model = recommender.image_model()
+    if model is None:
+        raise HTTPException(status_code=503,
+                            detail=f"Image search unavailable: {recommender.image_unavailable_reason()}")
+    extractor = embedding.get_extractor(model)
+    data = await file.read(config.IMAGE_MAX_UPLOAD_BYTES + 1)
+    if len(data) > config.IMAGE_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image larger than {config.IMAGE_MAX_UPLOAD_BYTES} bytes")
+    # IMAGE_DEADLINE_MS covers decode, embedding and search together: each
+    # stage gets what the previous ones left
+    remaining = _budget(config.IMAGE_DEADLINE_MS)
+    t = metrics.StageTimer("by_image_request")
+    try:
+        image = await pool.run(extractor.load_image, data, deadline_s=remaining())
+        t.lap("decode")
+        vector = await image_batcher.submit(image, deadline_s=remaining(), key=model)
+        t.lap("embed")
+        if recommender.image_model() != model:
+            # a reload swapped in catalog embeddings from another model meanwhile
+            raise HTTPException(status_code=503, detail="Catalog was reloaded during the request, retry",
+                                headers={"Retry-After": str(config.RECO_RETRY_AFTER_S)})
+        results = await _run(recommender.recommend_by_vector, budget_s=remaining(), vector=vector, top_k=top_k)
+        t.lap("search")
+        items = [
+            SimilarItem(
+                id=r["id"],
+                image_path=_build_image_url_safe(request, r.get("image_path", "") or ""),
+                score=r.get("score", 0.0)
+            )
+            for r in results
+        ]
+        response = SimilarResponse(query_id=file.filename or "upload", results=items)
+        t.lap("response")
+        metrics.REQUEST_SECONDS.observe(t.total(), "by_image")
+        return response
+    except HTTPException:
+        raise
+    except embedding.ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ImportError as e:
+        raise HTTPException(status_code=503, detail=f"Image model unavailable: {e}")
+    except (Overloaded, DeadlineExceeded) as e:
+        raise _busy_error(e)
+    except Exception as e:
+        logger.exception("Error in post_by_image")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _check_admin(token: str):
+    # no token configured: the admin endpoints don't exist
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(token.encode(), config.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@router.post("/admin/reload", status_code=202)
+def post_admin_reload(x_admin_token: str = Header("")):
+    """Load the current artifacts on disk in the background and swap them in when valid."""
+    _check_admin(x_admin_token)
+    started = reloader.reload_in_background()
+    return {"started": started, **reloader.status()}
+
+
+@router.get("/admin/reload")
+def get_admin_reload(x_admin_token: str = Header("")):
+    _check_admin(x_admin_token)
+    return reloader.status()
@@ -0,0 +1,421 @@
+# backend/fastapi-ai/app/services/ann_index.py
+"""
+Nearest-neighbour index backends for visual similarity.
+
+Every backend exposes the same `search(queries, k)` call and returns
+(scores, indices) with cosine similarity scores, best first. Row positions
+refer to the embedding matrix the index was built from, so they line up
+with the index map used by the recommender.
+
+Backends:
+  - BruteForceIndex: exact search, one matrix product per query batch.
+  - IVFIndex:        inverted-file index (spherical k-means coarse quantizer),
+                     scans only the `nprobe` closest lists. NumPy only.
+  - HNSWIndex:       FAISS HNSW graph (optional, requires faiss-cpu).
+  - SklearnIndex:    adapter around a pickled sklearn NearestNeighbors.
+
+NeighborTable is not a search backend: it stores the exact top-K neighbours
+of every catalog row, computed offline, so similar-item lookups for catalog
+items are an array slice.
+
+This module is also imported by data/scripts/build_index_and_clusters.py,
+so it must not depend on the rest of the app package.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+
+
+def l2_normalize(x: np.ndarray, dtype=np.float32, block: int = 8192) -> np.ndarray:
+    """
+    Return a C-contiguous copy of `x` with unit-length rows, stored as `dtype`.
+    Rows are processed in blocks so a float64 input never needs a second
+    full-size float64 temporary.
+    """
+    x = np.atleast_2d(x)
+    out = np.empty(x.shape, dtype=dtype)
+    for start in range(0, x.shape[0], block):
+        chunk = np.asarray(x[start:start + block], dtype=np.float32)
+        norms = np.linalg.norm(chunk, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        out[start:start + block] = chunk / norms
+    return out
+
+
+def dot_scores(vectors: np.ndarray, queries: np.ndarray, block: int = 8192) -> np.ndarray:
+    """
+    (n_queries, n) inner products of float32 queries against `vectors`.
+    float32 matrices go straight to BLAS; float16 storage is upcast one
+    block at a time so we never materialize a full float32 copy.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    if vectors.dtype == np.float32:
+        return queries @ vectors.T
+    out = np.empty((queries.shape[0], vectors.shape[0]), dtype=np.float32)
+    for start in range(0, vectors.shape[0], block):
+        out[:, start:start + block] = queries @ vectors[start:start + block].astype(np.float32).T
+    return out
+
+
+def topk(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Row-wise top-k of a (n_queries, n) score matrix using argpartition.
+    Returns (scores, indices), each (n_queries, k), sorted descending.
+    """
+    n = scores.shape[1]
+    k = min(k, n)
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(scores.dtype), empty.astype(np.int64)
+    if k < n:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.tile(np.arange(n), (scores.shape[0], 1))
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    return np.take_along_axis(part_scores, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+
+class VectorIndex:
+    """Common interface for all backends."""
+    backend = "base"
+    suffix = ""
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        queries: (n_queries, D) array.
+        Returns (scores, indices) of shape (n_queries, k). When fewer than k
+        neighbours are reachable the tail is padded with index -1.
+        """
+        raise NotImplementedError
+
+    def save(self, path: str):
+        raise NotImplementedError
+
+    def params(self) -> Dict:
+        return {}
+
+
+class BruteForceIndex(VectorIndex):
+    backend = "brute"
+
+    def __init__(self, vectors: np.ndarray, normalized: bool = False):
+        self.vectors = vectors if normalized else l2_normalize(vectors)
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    def search(self, queries, k):
+        q = l2_normalize(queries)
+        return topk(dot_scores(self.vectors, q), k)
+
+
+class IVFIndex(VectorIndex):
+    """
+    Inverted-file index. Vectors are bucketed by their nearest centroid and
+    stored as (list_offsets, list_members) so a list is a contiguous slice.
+    Only the centroids and list layout are persisted; the vectors themselves
+    are attached at load time from the embedding matrix.
+    """
+    backend = "ivf"
+    suffix = ".npz"
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, members: np.ndarray,
+                 vectors: Optional[np.ndarray] = None, nprobe: int = 8):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.offsets = offsets
+        self.members = members
+        self.vectors = vectors
+        self.nprobe = nprobe
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, nlist: int = 256, nprobe: int = 8,
+              train_size: int = 100000, seed: int = 42) -> "IVFIndex":
+        from sklearn.cluster import MiniBatchKMeans
+
+        x = l2_normalize(vectors)
+        nlist = max(1, min(nlist, x.shape[0]))
+        rng = np.random.default_rng(seed)
+        sample = x if x.shape[0] <= train_size else x[rng.choice(x.shape[0], train_size, replace=False)]
+        km = MiniBatchKMeans(n_clusters=nlist, random_state=seed, batch_size=4096, n_init=3).fit(sample)
+        centroids = l2_normalize(km.cluster_centers_)
+        assign = np.empty(x.shape[0], dtype=np.int64)
+        for start in range(0, x.shape[0], 8192):
+            assign[start:start + 8192] = np.argmax(x[start:start + 8192] @ centroids.T, axis=1)
+        members = np.argsort(assign, kind="stable").astype(np.int32)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+        return cls(centroids, offsets, members, vectors=x, nprobe=nprobe)
+
+    @classmethod
+    def from_labels(cls, centroids: np.ndarray, labels: np.ndarray, vectors: np.ndarray,
+                    nprobe: int = 8, normalized: bool = False) -> "IVFIndex":
+        """
+        Build the list layout from an existing clustering (e.g. the KMeans model
+        produced by build_index_and_clusters.py). Centroids are normalized so the
+        lists are probed by cosine similarity like everything else.
+        """
+        labels = np.asarray(labels, dtype=np.int64)
+        nlist = centroids.shape[0]
+        members = np.argsort(labels, kind="stable").astype(np.int32)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=nlist))]).astype(np.int64)
+        index = cls(l2_normalize(centroids), offsets, members, nprobe=nprobe)
+        return index.attach(vectors, normalized=normalized)
+
+    def attach(self, vectors: np.ndarray, normalized: bool = False) -> "IVFIndex":
+        if vectors.shape[0] != len(self.members):
+            raise ValueError(f"IVF index covers {len(self.members)} rows but embeddings have {vectors.shape[0]}")
+        self.vectors = vectors if normalized else l2_normalize(vectors)
+        return self
+
+    def search(self, queries, k):
+        if self.vectors is None:
+            raise RuntimeError("IVF index has no vectors attached")
+        q = l2_normalize(queries)
+        nprobe = min(self.nprobe, self.nlist)
+        _, probes = topk(q @ self.centroids.T, nprobe)
+        out_scores = np.full((q.shape[0], k), -np.inf, dtype=np.float32)
+        out_idx = np.full((q.shape[0], k), -1, dtype=np.int64)
+        for qi in range(q.shape[0]):
+            cand = np.concatenate([self.members[self.offsets[l]:self.offsets[l + 1]] for l in probes[qi]])
+            if cand.size == 0:
+                continue
+            s = dot_scores(self.vectors[cand], q[qi:qi + 1])
+            ts, ti = topk(s, k)
+            out_scores[qi, :ts.shape[1]] = ts[0]
+            out_idx[qi, :ti.shape[1]] = cand[ti[0]]
+        return out_scores, out_idx
+
+    def save(self, path: str):
+        np.savez(path, centroids=self.centroids, offsets=self.offsets, members=self.members)
+
+    @classmethod
+    def load(cls, path: str, nprobe: int = 8) -> "IVFIndex":
+        with np.load(path) as z:
+            return cls(z["centroids"], z["offsets"], z["members"], nprobe=nprobe)
+
+    def params(self) -> Dict:
+        return {"nlist": self.nlist, "nprobe": self.nprobe}
+
+
+class HNSWIndex(VectorIndex):
+    """FAISS HNSW graph over inner product of normalized vectors."""
+    backend = "hnsw"
+    suffix = ".faiss"
+
+    def __init__(self, index, ef_search: int = 64):
+        self.index = index
+        self.ef_search = ef_search
+        self.index.hnsw.efSearch = ef_search
+
+    def __len__(self) -> int:
+        return self.index.ntotal
+
+    @staticmethod
+    def _faiss():
+        try:
+            import faiss
+        except ImportError as e:
+            raise ImportError("The 'hnsw' backend requires faiss-cpu (pip install faiss-cpu)") from e
+        return faiss
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, m: int = 32, ef_construction: int = 200,
+              ef_search: int = 64) -> "HNSWIndex":
+        faiss = cls._faiss()
+        x = l2_normalize(vectors)
+        index = faiss.IndexHNSWFlat(x.shape[1], m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+        index.add(x)
+        return cls(index, ef_search=ef_search)
+
+    def search(self, queries, k):
+        q = l2_normalize(queries)
+        scores, idx = self.index.search(q, k)
+        return scores, idx.astype(np.int64)
+
+    def save(self, path: str):
+        self._faiss().write_index(self.index, path)
+
+    @classmethod
+    def load(cls, path: str, ef_search: int = 64) -> "HNSWIndex":
+        return cls(cls._faiss().read_index(path), ef_search=ef_search)
+
+    def params(self) -> Dict:
+        return {"efConstruction": self.index.hnsw.efConstruction, "efSearch": self.ef_search}
+
+
+class SklearnIndex(VectorIndex):
+    """Adapter so a pickled sklearn NearestNeighbors (cosine) looks like the other backends."""
+    backend = "sklearn"
+
+    def __init__(self, nn):
+        self.nn = nn
+
+    def __len__(self) -> int:
+        return self.nn.n_samples_fit_
+
+    def search(self, queries, k):
+        k = min(k, len(self))
+        distances, indices = self.nn.kneighbors(np.atleast_2d(queries), n_neighbors=k)
+        return 1 - distances, indices
+
+
+BACKENDS = {
+    "brute": BruteForceIndex,
+    "ivf": IVFIndex,
+    "hnsw": HNSWIndex,
+    "sklearn": SklearnIndex,
+}
+
+
+def embeddings_fingerprint(embs: np.ndarray, samples: int = 64) -> str:
+    """Cheap identity of an embedding matrix: shape, dtype and a fixed sample of its rows."""
+    n = embs.shape[0]
+    rows = np.unique(np.linspace(0, max(n - 1, 0), min(samples, n)).astype(np.int64))
+    h = hashlib.sha256(f"{embs.shape}|{embs.dtype}".encode())
+    h.update(np.ascontiguousarray(embs[rows]).tobytes())
+    return h.hexdigest()
+
+
+class NeighborTable:
+    """
+    Exact top-k cosine neighbours of every row of an embedding matrix, the
+    row itself excluded, best first. Neighbour positions are int32 and scores
+    float16 (6 bytes per neighbour); both are memory-mapped on load.
+
+    Stored as a directory with ids.npy, scores.npy and meta.json (k, rows and
+    the fingerprint of the embeddings it was computed from), swapped in whole
+    so readers never see a half-written table.
+    """
+    IDS_FNAME = "ids.npy"
+    SCORES_FNAME = "scores.npy"
+    META_FNAME = "meta.json"
+
+    def __init__(self, ids: np.ndarray, scores: np.ndarray, meta: Dict):
+        self.ids = ids
+        self.scores = scores
+        self.meta = meta
+
+    @property
+    def k(self) -> int:
+        return self.ids.shape[1]
+
+    def __len__(self) -> int:
+        return self.ids.shape[0]
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, k: int, block: int = 1024, workers: int = 1) -> "NeighborTable":
+        """
+        All-pairs exact search in blocks of `block` query rows: one GEMM
+        (block x N) per block, then a partial top-k. `workers` blocks run
+        concurrently (NumPy releases the GIL in both), each holding a
+        block x N float32 score matrix.
+        """
+        start = time.perf_counter()
+        x = l2_normalize(vectors)
+        n = x.shape[0]
+        k = max(0, min(k, n - 1))
+        ids = np.empty((n, k), dtype=np.int32)
+        scores = np.empty((n, k), dtype=np.float16)
+
+        def run(lo: int):
+            hi = min(lo + block, n)
+            sims = x[lo:hi] @ x.T
+            sims[np.arange(hi - lo), np.arange(lo, hi)] = -np.inf  # never its own neighbour
+            s, i = topk(sims, k)
+            ids[lo:hi] = i
+            scores[lo:hi] = s
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+            list(ex.map(run, range(0, n, block)))
+        meta = {"k": k, "rows": n, "fingerprint": embeddings_fingerprint(vectors),
+                "built_at": time.time(), "build_s": round(time.perf_counter() - start, 2)}
+        return cls(ids, scores, meta)
+
+    def save(self, path: str):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        np.save(os.path.join(tmp, self.IDS_FNAME), self.ids)
+        np.save(os.path.join(tmp, self.SCORES_FNAME), self.scores)
+        with open(os.path.join(tmp, self.META_FNAME), "w") as f:
+            json.dump(self.meta, f)
+        old = f"{path}.old"
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(path):
+            os.replace(path, old)
+        os.replace(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "NeighborTable":
+        mode = "r" if mmap else None
+        with open(os.path.join(path, cls.META_FNAME)) as f:
+            meta = json.load(f)
+        ids = np.load(os.path.join(path, cls.IDS_FNAME), mmap_mode=mode).view(np.ndarray)
+        scores = np.load(os.path.join(path, cls.SCORES_FNAME), mmap_mode=mode).view(np.ndarray)
+        if ids.shape != scores.shape:
+            raise ValueError(f"neighbour table {path}: ids {ids.shape} and scores {scores.shape} differ")
+        return cls(ids, scores, meta)
+
+    def lookup(self, row: int, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(scores, positions) of the first k neighbours of `row`, as float32 / int64."""
+        return self.scores[row, :k].astype(np.float32), self.ids[row, :k].astype(np.int64)
+
+
+def evaluate(index: VectorIndex, exact: VectorIndex, queries: np.ndarray,
+             ks: Sequence[int] = (1, 10, 50)) -> Dict:
+    """
+    Measure recall@k of `index` against an exact reference and per-query latency.
+    The query row itself is counted like any other neighbour on both sides.
+    """
+    k_max = max(ks)
+    _, truth = exact.search(queries, k_max)
+    latencies = []
+    found = []
+    for q in queries:
+        t0 = time.perf_counter()
+        _, idx = index.search(q[None, :], k_max)
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        found.append(idx[0])
+    found = np.vstack(found)
+    recall = {}
+    for k in ks:
+        hits = [len(np.intersect1d(found[i, :k], truth[i, :k])) for i in range(len(queries))]
+        recall[f"recall@{k}"] = float(np.mean(hits) / k)
+    lat = np.asarray(latencies)
+    return {
+        "backend": index.backend,
+        "params": index.params(),
+        **recall,
+        "latency_ms_p50": float(np.percentile(lat, 50)),
+        "latency_ms_p95": float(np.percentile(lat, 95)),
+        "latency_ms_mean": float(lat.mean()),
+    }
+
+
+def format_report(rows: List[Dict]) -> str:
+    """Render evaluate() results as a plain-text table."""
+    if not rows:
+        return ""
+    cols = [c for c in rows[0] if c != "params"]
+    lines = ["  ".join(f"{c:>16}" for c in cols + ["params"])]
+    for r in rows:
+        cells = [f"{r[c]:>16.4f}" if isinstance(r[c], float) else f"{str(r[c]):>16}" for c in cols]
+        lines.append("  ".join(cells + [json.dumps(r.get("params", {}))]))
+    return "\n".join(lines)
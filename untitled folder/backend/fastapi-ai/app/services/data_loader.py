@@ -1,6 +1,22 @@
 import os
 import pandas as pd
-from typing import Tuple
+from typing import Optional, Tuple
+
+# Dataset `gender` values matched by each requested gender (compared lowercased).
+# Anything not listed here is matched against the dataset values as-is.
+GENDER_VALUES = {
+    'male': ('men', 'boys', 'unisex'),
+    'men': ('men', 'boys', 'unisex'),
+    'female': ('women', 'girls', 'unisex'),
+    'women': ('women', 'girls', 'unisex'),
+}
+
+def gender_values(gender: Optional[str]) -> Tuple[str, ...]:
+    """Lowercased dataset gender values to keep for a requested gender ('' / 'other' -> no filter)."""
+    g = (gender or '').strip().lower()
+    if not g or g == 'other':
+        return ()
+    return GENDER_VALUES.get(g, (g,))
 
 def load_styles_csv(data_root: str) -> pd.DataFrame:
     styles_path = os.path.join(data_root, 'styles.csv')
@@ -21,5 +37,8 @@ def load_styles_csv(data_root: str) -> pd.DataFrame:
     return df
 
 def filter_by_gender(df: pd.DataFrame, gender: str) -> pd.DataFrame:
-    g = 'Men' if gender.lower() == 'male' else 'Women'
-    return df[df['gender'].str.lower().str.contains(g.lower(), na=False)]
+    values = gender_values(gender)
+    if not values:
+        return df
+    # exact categorical match: substring matching let 'men' match 'Women'
+    return df[df['gender'].str.lower().isin(values)]
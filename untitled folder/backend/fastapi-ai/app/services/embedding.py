@@ -1,35 +1,292 @@
+# backend/fastapi-ai/app/services/embedding.py
+"""
+Image feature extractors shared by the offline pipeline and the API.
+
+Every embedding model is an Extractor in EXTRACTORS. The same object decodes
+images (load_image), applies the model's preprocessing (preprocess) and runs
+batched inference (forward / embed_batch), so data/scripts/extract_embeddings.py
+and POST /by-image produce vectors in the same space by construction. Its
+manifest() is written next to embeddings.npy and checked by utils/loader.py at
+load time, so catalog vectors and online queries can never silently disagree
+on model, dimension or preprocessing.
+
+Deep learning frameworks (torch, TensorFlow) and OpenCV are imported on first
+use, not at module import, so processes that never compute an embedding don't
+pay seconds of import time and hundreds of MB of memory. Call warm_up() off the
+request path to build a model and run one dummy inference before the first
+real request arrives.
+"""
+import io
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
 import numpy as np
-import cv2
-from typing import Tuple
 from PIL import Image
-import tensorflow as tf
 
-# Build a MobileNetV2 feature extractor
-_mobilenet = None
-_preprocess = tf.keras.applications.mobilenet_v2.preprocess_input
+logger = logging.getLogger(__name__)
+
+# seconds spent in each warm-up phase: import, build_model, first_inference
+WARMUP_TIMINGS: Dict[str, float] = {}
+
+_RESAMPLE = {"bilinear": Image.BILINEAR, "bicubic": Image.BICUBIC}
+
+
+class ImageDecodeError(ValueError):
+    """The input is not a decodable image (a client error, unlike other ValueErrors)."""
+
+
+class Extractor:
+    """Base class: decode + preprocess in NumPy, forward pass in the model's framework."""
+
+    name = ""
+    framework = ""
+    weights = ""
+    dim = 0
+    input_size = (224, 224)
+    resample = "bilinear"
+    layout = "NHWC"
+
+    def __init__(self, device: Optional[str] = None):
+        self.device = device
+        self._model = None
+        self._lock = threading.Lock()
+
+    def preprocessing(self) -> Dict[str, Any]:
+        """Everything that affects the input tensor; part of the manifest."""
+        return {"size": list(self.input_size), "resample": self.resample, "layout": self.layout}
+
+    def manifest(self) -> Dict[str, Any]:
+        return {
+            "model": self.name,
+            "framework": self.framework,
+            "weights": self.weights,
+            "dim": self.dim,
+            "preprocessing": self.preprocessing(),
+            # vectors are stored raw; loader L2-normalizes catalog rows and
+            # recommender.recommend_by_vector normalizes queries
+            "normalization": "l2",
+        }
+
+    def load_image(self, source) -> np.ndarray:
+        """
+        Decode an image (path, file object or raw bytes) into an RGB float32
+        (H, W, 3) array at input_size. Raises ImageDecodeError if the data is
+        not a decodable image.
+        """
+        if isinstance(source, (bytes, bytearray)):
+            source = io.BytesIO(source)
+        try:
+            with Image.open(source) as img:
+                img = img.convert('RGB').resize(self.input_size, _RESAMPLE[self.resample])
+                return np.asarray(img, dtype=np.float32)
+        except (OSError, Image.DecompressionBombError) as e:
+            raise ImageDecodeError(f"Not a decodable image: {e}") from e
+
+    def preprocess(self, images: np.ndarray) -> np.ndarray:
+        """(n, H, W, 3) RGB 0..255 arrays from load_image() -> model input batch."""
+        raise NotImplementedError
+
+    def _build(self):
+        raise NotImplementedError
+
+    def forward(self, x) -> np.ndarray:
+        """Preprocessed batch -> (n, dim) float32 features."""
+        raise NotImplementedError
+
+    def __getstate__(self):
+        # shipped to DataLoader worker processes for decode/preprocess only
+        state = self.__dict__.copy()
+        state["_model"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._build()
+        return self._model
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._model is not None
+
+    def embed_batch(self, images: np.ndarray) -> np.ndarray:
+        """(n, H, W, 3) RGB arrays from load_image() -> (n, dim) float32 embeddings."""
+        return self.forward(self.preprocess(images))
+
+
+class ResNet50Extractor(Extractor):
+    """torchvision ResNet50 without its FC layer; the catalog embedding model."""
+
+    name = "resnet50"
+    framework = "torch"
+    weights = "IMAGENET1K_V1"
+    dim = 2048
+    layout = "NCHW"
+    mean = (0.485, 0.456, 0.406)
+    std = (0.229, 0.224, 0.225)
+
+    def preprocessing(self) -> Dict[str, Any]:
+        return {**super().preprocessing(), "scale": 1 / 255, "mean": list(self.mean), "std": list(self.std)}
+
+    def preprocess(self, images: np.ndarray) -> np.ndarray:
+        x = np.asarray(images, dtype=np.float32) / 255.0
+        x = (x - np.asarray(self.mean, dtype=np.float32)) / np.asarray(self.std, dtype=np.float32)
+        return np.ascontiguousarray(x.transpose(0, 3, 1, 2))
+
+    def _build(self):
+        import torch
+        from torchvision import models
+        device = torch.device(self.device or ("cuda" if torch.cuda.is_available() else "cpu"))
+        self.device = device.type
+        model = models.resnet50(weights=models.ResNet50_Weights.IMAGENET1K_V1)
+        # remove final fully connected layer
+        model = torch.nn.Sequential(*list(model.children())[:-1])
+        model.eval().to(device)
+        if device.type == "cpu":
+            model = model.to(memory_format=torch.channels_last)
+        return model
 
-def _load_model():
-    global _mobilenet
-    if _mobilenet is None:
-        base = tf.keras.applications.MobileNetV2(include_top=False, pooling='avg', weights='imagenet')
-        _mobilenet = base
-    return _mobilenet
+    def forward(self, x) -> np.ndarray:
+        import torch
+        model = self.model
+        x = torch.as_tensor(x).to(self.device, non_blocking=True)
+        if self.device == "cpu":
+            x = x.contiguous(memory_format=torch.channels_last)
+        with torch.inference_mode():
+            feat = model(x)  # shape [B, 2048, 1, 1]
+        return feat.reshape(feat.size(0), -1).float().cpu().numpy()  # [B,2048]
 
-def compute_image_embedding(image_path: str) -> np.ndarray:
+
+class MobileNetV2Extractor(Extractor):
+    """Keras MobileNetV2 with global average pooling."""
+
+    name = "mobilenet_v2"
+    framework = "tensorflow"
+    weights = "imagenet"
+    dim = 1280
+    resample = "bicubic"
+
+    def preprocessing(self) -> Dict[str, Any]:
+        # same as tf.keras.applications.mobilenet_v2.preprocess_input
+        return {**super().preprocessing(), "scale": 1 / 127.5, "offset": -1.0}
+
+    def preprocess(self, images: np.ndarray) -> np.ndarray:
+        return np.asarray(images, dtype=np.float32) / 127.5 - 1.0
+
+    def _build(self):
+        import tensorflow as tf
+        return tf.keras.applications.MobileNetV2(include_top=False, pooling='avg', weights='imagenet')
+
+    def forward(self, x) -> np.ndarray:
+        return np.asarray(self.model(x, training=False)).astype(np.float32, copy=False)
+
+
+EXTRACTORS = {cls.name: cls for cls in (ResNet50Extractor, MobileNetV2Extractor)}
+DEFAULT_MODEL = ResNet50Extractor.name
+
+_instances: Dict[str, Extractor] = {}
+_instances_lock = threading.Lock()
+
+
+def get_extractor(name: str = DEFAULT_MODEL) -> Extractor:
+    """Shared per-process instance of the named extractor (the model is built on first use)."""
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown embedding model '{name}'; choose from {sorted(EXTRACTORS)}")
+    with _instances_lock:
+        if name not in _instances:
+            _instances[name] = EXTRACTORS[name]()
+        return _instances[name]
+
+
+def warm_up(name: str = DEFAULT_MODEL) -> Dict[str, float]:
+    """
+    Build the named model and run one dummy inference so the first request
+    doesn't pay for framework import and graph set-up. Returns the phase timings.
+    """
+    extractor = get_extractor(name)
+
+    start = time.perf_counter()
+    __import__(extractor.framework)
+    WARMUP_TIMINGS["import"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    extractor.model
+    WARMUP_TIMINGS["build_model"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    extractor.embed_batch(np.zeros((1, *extractor.input_size, 3), dtype=np.float32))
+    WARMUP_TIMINGS["first_inference"] = time.perf_counter() - start
+
+    logger.info(f"Embedding model {name} warm-up: " +
+                " ".join(f"{k}={v:.2f}s" for k, v in WARMUP_TIMINGS.items()))
+    return dict(WARMUP_TIMINGS)
+
+
+def warm_up_in_background(name: str = DEFAULT_MODEL) -> Optional[threading.Thread]:
+    """Run warm_up() on a daemon thread; failures (e.g. framework missing) are logged, not raised."""
+    def _target():
+        try:
+            warm_up(name)
+        except Exception as e:
+            logger.warning(f"Embedding model warm-up failed: {e}")
+
+    t = threading.Thread(target=_target, name="embedding-warmup", daemon=True)
+    t.start()
+    return t
+
+
+def compute_image_embedding(image_path: str, model: str = MobileNetV2Extractor.name) -> np.ndarray:
+    extractor = get_extractor(model)
     try:
-        model = _load_model()
-        img = Image.open(image_path).convert('RGB').resize((224, 224))
-        x = np.array(img, dtype=np.float32)
-        x = _preprocess(x)
-        x = np.expand_dims(x, axis=0)
-        feat = model(x).numpy().squeeze()
-        return feat.astype(np.float32)
+        return extractor.embed_batch(extractor.load_image(image_path)[None])[0]
     except Exception:
         # If image fails, return zeros to avoid breaking pipeline
-        return np.zeros((1280,), dtype=np.float32)
+        return np.zeros((extractor.dim,), dtype=np.float32)
+
+
+# Compact color descriptor: HSV histogram with 8 hue x 3 saturation x 3 value
+# bins, computed with PIL so the offline build needs no OpenCV.
+COLOR_BINS = (8, 3, 3)
+COLOR_DIM = int(np.prod(COLOR_BINS))
+
+
+def color_descriptor(source, size: int = 64) -> np.ndarray:
+    """
+    (COLOR_DIM,) float32 descriptor of an image path, file object or bytes.
+    Near-white pixels (the studio background of catalog shots) are ignored.
+    Bin masses are square-rooted and L2-normalized, so the dot product of two
+    descriptors is their Bhattacharyya coefficient (1 = same color
+    distribution, 0 = disjoint). Raises ImageDecodeError for undecodable images.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    try:
+        with Image.open(source) as img:
+            hsv = np.asarray(img.convert('RGB').resize((size, size), Image.BILINEAR).convert('HSV'))
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ImageDecodeError(f"Not a decodable image: {e}") from e
+    h, s, v = (hsv[..., c].reshape(-1).astype(np.int32) for c in range(3))
+    keep = ~((s < 20) & (v > 235))
+    if not keep.any():
+        keep[:] = True
+    hb, sb, vb = COLOR_BINS
+    codes = (h[keep] * hb // 256) * (sb * vb) + (s[keep] * sb // 256) * vb + (v[keep] * vb // 256)
+    hist = np.sqrt(np.bincount(codes, minlength=COLOR_DIM).astype(np.float32))
+    return hist / np.linalg.norm(hist)
+
 
 def compute_color_hist(image_path: str, bins: int = 16) -> np.ndarray:
     try:
+        import cv2
         img = cv2.imread(image_path)
         img = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
         hist = cv2.calcHist([img], [0,1,2], None, [bins,bins,bins], [0,180,0,256,0,256])
@@ -1,132 +1,536 @@
 # backend/fastapi-ai/app/services/recommender.py
 from typing import List, Dict, Any, Optional
+import os
+import time
 import numpy as np
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
-from scipy.spatial.distance import cdist
 import logging
 
-from ..utils import loader
+from .. import config
+from ..utils import loader, metrics
+from ..utils.cache import TTLCache
+from .ann_index import IVFIndex, dot_scores, topk
+from .data_loader import gender_values
+from .text_index import AnswerVectors, InvertedIndex
 
 logger = logging.getLogger(__name__)
 
-# Global placeholders (will be set in init)
-EMBS = None             # numpy array (N x D)
-IDX_DF = None           # dataframe with 'id' and 'image_path' and metadata
-NN = None               # sklearn NearestNeighbors object (optional)
-KMEANS = None
-VECTORIZER = None
-TFIDF_MATRIX = None
+# Categorical attributes integer-coded per index row, so filters are boolean
+# masks instead of per-row string checks.
+FILTER_COLUMNS = ("gender", "masterCategory", "articleType", "baseColour", "season", "usage")
+
+# Fields a client may select with /by-quiz?fields=...; the FILTER_COLUMNS
+# attributes are served from the integer codes, not from a dataframe.
+RESULT_FIELDS = ("id", "image_path", "score", "metadata") + FILTER_COLUMNS
 
-def init(resources: Dict[str, Any]):
-    global EMBS, IDX_DF, NN, KMEANS, VECTORIZER, TFIDF_MATRIX
-    EMBS = resources.get("embeddings")
-    IDX_DF = resources.get("index_df")
-    NN = resources.get("nn")
-    KMEANS = resources.get("kmeans")
-    VECTORIZER = resources.get("vectorizer")
-    TFIDF_MATRIX = resources.get("tfidf")
 
-def recommend_similar(product_id: str, top_k: int = 10) -> List[Dict[str, Any]]:
+class Bundle:
     """
-    Return top_k visually similar items to the product_id.
+    One immutable, versioned set of serving artifacts plus everything derived
+    from them at load time. Request handlers read the module-level BUNDLE once
+    and use that object throughout, so swapping BUNDLE never affects a request
+    that is already running.
+    """
+
+    def __init__(self, version: int):
+        self.version = version
+        self.loaded_at = time.time()
+        self.embs = None            # numpy array (N x D), L2-normalized rows (float32 or float16)
+        self.idx_df = None          # dataframe with 'id' and 'image_path' and metadata
+        self.nn = None              # ann_index.VectorIndex (optional)
+        self.kmeans = None
+        self.cluster_index = None   # IVFIndex over kmeans clusters, used when config.CLUSTER_NPROBE > 0
+        self.vectorizer = None
+        self.tfidf = None           # CSR matrix, rows aligned with idx_df
+        self.text_index = None      # text_index.InvertedIndex over tfidf (term -> postings)
+        self.answer_vectors = None  # text_index.AnswerVectors for the quiz's fixed answers (optional)
+        self.colors = None          # (N x COLOR_DIM) float16 color descriptors, rows aligned with embs (optional)
+        self.neighbors = None       # ann_index.NeighborTable: precomputed top-K per row (optional)
+        self.manifest = None        # embeddings manifest (model, dim, preprocessing), None for legacy data
+        self.manifest_error = None  # why the manifest doesn't fit the embeddings / extractor; disables image queries
+        # Column-oriented views of idx_df so the request path never has to
+        # scan or index into the dataframe.
+        self.ids = None             # numpy object array of str ids (row position -> id)
+        self.image_paths = None     # numpy object array of image paths (row position -> path)
+        self.public_paths = None    # numpy object array of URL paths under config.STATIC_IMAGES_PATH
+        self.meta_columns = {}      # index map column -> numpy object array, for result metadata
+        self.id_to_pos = None       # dict: str id -> row position
+        self.attr_codes = {}        # column -> int16 array of category codes (-1 = missing)
+        self.attr_lookup = {}       # column -> {lowercased value: code}
+        self.attr_values = {}       # column -> object array code -> display value ("" at -1)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "items": 0 if self.ids is None else len(self.ids),
+            "embedding_dim": None if self.embs is None else int(self.embs.shape[1]),
+            "embedding_model": (self.manifest or {}).get("model"),
+            "manifest_error": self.manifest_error,
+            "nn_backend": getattr(self.nn, "backend", None),
+            "cluster_routing": self.cluster_index is not None,
+            "text_index": self.tfidf is not None,
+            "quiz_answers": 0 if self.answer_vectors is None else len(self.answer_vectors),
+            "color_index": self.colors is not None,
+            "neighbor_table_k": None if self.neighbors is None else self.neighbors.k,
+        }
+
+
+# The live bundle. Replaced wholesale by init()/swap(); never mutated in place.
+BUNDLE: Optional[Bundle] = None
+RESULT_CACHE = TTLCache(config.RESULT_CACHE_MAX_BYTES, config.RESULT_CACHE_TTL_S)
+
+def _build_id_index(index_df: Optional[pd.DataFrame]):
     """
-    if IDX_DF is None or EMBS is None:
+    Build (ids, image_paths, id_to_pos) from the index map.
+    If an id appears more than once the first row wins, matching the old
+    `IDX_DF[IDX_DF['id'] == pid].index[0]` behaviour.
+    """
+    if index_df is None:
+        return None, None, None
+    ids = index_df['id'].astype(str).to_numpy(dtype=object)
+    if 'image_path' in index_df.columns:
+        image_paths = index_df['image_path'].fillna("").astype(str).to_numpy(dtype=object)
+    else:
+        image_paths = np.full(len(index_df), "", dtype=object)
+    id_to_pos: Dict[str, int] = {}
+    for pos, pid in enumerate(ids):
+        id_to_pos.setdefault(pid, pos)
+    return ids, image_paths, id_to_pos
+
+def _public_path(image_path: str) -> str:
+    """URL path of an image under the static mount (see main.py); "" if there is no image."""
+    name = os.path.basename(image_path) if image_path else ""
+    return f"{config.STATIC_IMAGES_PATH}/{name}" if name else ""
+
+def _metadata_rows(metadata_df: pd.DataFrame, ids: np.ndarray) -> np.ndarray:
+    """For every index row, the position of the same id in metadata_df (-1 if absent)."""
+    meta_pos: Dict[str, int] = {}
+    for pos, pid in enumerate(metadata_df['id'].astype(str)):
+        meta_pos.setdefault(pid, pos)
+    return np.fromiter((meta_pos.get(pid, -1) for pid in ids), dtype=np.int64, count=len(ids))
+
+def _align_text_matrix(tfidf, rows: np.ndarray):
+    """Reorder TF-IDF rows (metadata order) to index order; ids without metadata get empty rows."""
+    if len(rows) == tfidf.shape[0] and np.array_equal(rows, np.arange(len(rows))):
+        return tfidf
+    from scipy import sparse
+    valid = rows >= 0
+    aligned = tfidf.tocsr()[np.where(valid, rows, 0)]
+    return (sparse.diags(valid.astype(aligned.dtype)) @ aligned).tocsr()
+
+def _build_attr_codes(source: Optional[pd.DataFrame], rows: Optional[np.ndarray]):
+    """
+    Integer-code FILTER_COLUMNS of `source`, aligned to index rows via `rows`
+    (or row-for-row when rows is None).
+    """
+    codes, lookup, display = {}, {}, {}
+    if source is None:
+        return codes, lookup, display
+    for col in FILTER_COLUMNS:
+        if col not in source.columns:
+            continue
+        values = source[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # already coded (columnar metadata): only clean the categories, then remap codes
+            cat = pd.Categorical(pd.Index(values.cat.categories).astype(str).str.strip())
+            old = np.asarray(values.cat.codes)
+            col_codes = np.where(old >= 0, cat.codes[np.maximum(old, 0)], -1).astype(np.int16)
+        else:
+            cat = pd.Categorical(values.fillna("").astype(str).str.strip())
+            col_codes = cat.codes.astype(np.int16)
+        if rows is not None:
+            col_codes = np.where(rows >= 0, col_codes[np.where(rows >= 0, rows, 0)], -1).astype(np.int16)
+        codes[col] = col_codes
+        lookup[col] = {str(v).lower(): i for i, v in enumerate(cat.categories) if v != ""}
+        # trailing "" so that code -1 (missing) indexes to an empty value
+        display[col] = np.array([str(v) for v in cat.categories] + [""], dtype=object)
+    return codes, lookup, display
+
+def attribute_mask(b: Bundle, filters: Dict[str, Any]) -> Optional[np.ndarray]:
+    """
+    Boolean mask over index rows for {column: value or [values]}.
+    Values are OR-ed within a column (case-insensitive), columns are AND-ed.
+    Returns None when no filter applies.
+    """
+    mask = None
+    for col, values in filters.items():
+        if col not in b.attr_codes or values is None:
+            continue
+        if isinstance(values, str):
+            values = [values]
+        lookup = b.attr_lookup[col]
+        wanted = [lookup[v.lower()] for v in values if v.lower() in lookup]
+        col_mask = np.isin(b.attr_codes[col], np.asarray(wanted, dtype=np.int16))
+        mask = col_mask if mask is None else mask & col_mask
+    return mask
+
+def _build_cluster_index(kmeans, embs: np.ndarray, index_df: Optional[pd.DataFrame],
+                         nprobe: int) -> Optional[IVFIndex]:
+    """
+    Inverted lists over the existing KMeans clusters. Labels come from the
+    model itself (fit on the same matrix) or a 'cluster' column in the index map.
+    """
+    if kmeans is None or embs is None or nprobe <= 0:
+        return None
+    labels = getattr(kmeans, "labels_", None)
+    if (labels is None or len(labels) != embs.shape[0]) and index_df is not None and "cluster" in index_df.columns:
+        labels = pd.to_numeric(index_df["cluster"], errors="coerce").fillna(-1).to_numpy()
+    if labels is None or len(labels) != embs.shape[0] or (np.asarray(labels) < 0).any():
+        logger.warning("KMeans labels do not match the embedding matrix; cluster-routed search disabled")
+        return None
+    index = IVFIndex.from_labels(kmeans.cluster_centers_, labels, embs, nprobe=nprobe, normalized=True)
+    logger.info(f"Cluster-routed search enabled: {index.nlist} clusters, nprobe={nprobe}")
+    return index
+
+def build_bundle(resources: Dict[str, Any], version: int) -> Bundle:
+    """Build a Bundle from loader.load_resources() output without touching the live one."""
+    b = Bundle(version)
+    b.embs = resources.get("embeddings")
+    b.idx_df = resources.get("index_df")
+    b.nn = resources.get("nn")
+    b.kmeans = resources.get("kmeans")
+    b.vectorizer = resources.get("vectorizer")
+    b.tfidf = resources.get("tfidf")
+    b.manifest = resources.get("manifest")
+    b.manifest_error = resources.get("manifest_error")
+    b.colors = resources.get("colors")
+    b.neighbors = resources.get("neighbors")
+    b.ids, b.image_paths, b.id_to_pos = _build_id_index(b.idx_df)
+    if b.idx_df is not None:
+        b.public_paths = np.array([_public_path(p) for p in b.image_paths], dtype=object)
+        b.meta_columns = {c: b.idx_df[c].astype(object).fillna("").to_numpy(dtype=object) for c in b.idx_df.columns}
+    if b.id_to_pos is not None:
+        logger.info(f"Built id index: {len(b.id_to_pos)} unique ids over {len(b.ids)} rows")
+
+    # Attributes and TF-IDF rows come from the metadata file; line them up with
+    # the embedding index so one row position means the same item everywhere.
+    metadata_df = resources.get("metadata_df")
+    if metadata_df is not None and b.ids is not None and 'id' in metadata_df.columns:
+        rows = _metadata_rows(metadata_df, b.ids)
+        if b.tfidf is not None and b.tfidf.shape[0] == len(metadata_df):
+            b.tfidf = _align_text_matrix(b.tfidf, rows)
+        b.attr_codes, b.attr_lookup, b.attr_values = _build_attr_codes(metadata_df, rows)
+    else:
+        b.attr_codes, b.attr_lookup, b.attr_values = _build_attr_codes(b.idx_df, None)
+    if b.attr_codes:
+        logger.info(f"Built attribute codes for: {sorted(b.attr_codes)}")
+    if b.tfidf is not None:
+        b.text_index = InvertedIndex(b.tfidf)
+        logger.info(f"Built inverted text index: {b.text_index.n_terms} terms, {b.text_index.nnz} postings")
+        answers = resources.get("quiz_answers")
+        if answers and b.vectorizer is not None and AnswerVectors.supports(b.vectorizer):
+            b.answer_vectors = AnswerVectors(b.vectorizer, b.text_index, answers)
+            logger.info(f"Precomputed text vectors for {len(b.answer_vectors)} quiz answers")
+    b.cluster_index = _build_cluster_index(b.kmeans, b.embs, b.idx_df, config.CLUSTER_NPROBE)
+    return b
+
+def validate_bundle(b: Bundle):
+    """Raise ValueError if the artifacts in `b` are inconsistent or unusable."""
+    if b.embs is None or b.ids is None:
+        raise ValueError("bundle has no embeddings or index map")
+    n = len(b.ids)
+    if n == 0:
+        raise ValueError("index map is empty")
+    if b.embs.shape[0] != n:
+        raise ValueError(f"embeddings have {b.embs.shape[0]} rows but index map has {n}")
+    if b.tfidf is not None and b.tfidf.shape[0] != n:
+        raise ValueError(f"TF-IDF matrix has {b.tfidf.shape[0]} rows but index map has {n}")
+    if b.colors is not None and b.colors.shape[0] != n:
+        raise ValueError(f"color index has {b.colors.shape[0]} rows but index map has {n}")
+    if b.neighbors is not None and len(b.neighbors) != n:
+        raise ValueError(f"neighbour table has {len(b.neighbors)} rows but index map has {n}")
+    if b.nn is not None and len(b.nn) != n:
+        raise ValueError(f"NN index covers {len(b.nn)} rows but index map has {n}")
+    sample = np.asarray(b.embs[:min(n, 1024)], dtype=np.float32)
+    if not np.isfinite(sample).all():
+        raise ValueError("embeddings contain NaN/inf values")
+    # one end-to-end query against the new bundle
+    _similar(b, str(b.ids[0]), 1)
+
+def swap(b: Bundle):
+    """Atomically make `b` the live bundle and drop results cached for the old one."""
+    global BUNDLE
+    BUNDLE = b
+    RESULT_CACHE.clear()
+    logger.info(f"Recommender bundle v{b.version} is live ({b.describe()})")
+
+def next_version() -> int:
+    return 1 if BUNDLE is None else BUNDLE.version + 1
+
+def init(resources: Dict[str, Any]):
+    b = build_bundle(resources, next_version())
+    validate_bundle(b)
+    swap(b)
+
+def _live() -> Bundle:
+    b = BUNDLE
+    if b is None or b.idx_df is None or b.embs is None:
         raise RuntimeError("Recommender not initialized with embeddings/index")
+    return b
+
+def normalize_answers(answers: List[str]) -> List[str]:
+    """Quiz answers are an unordered set: strip, drop empties and sort."""
+    return sorted(a.strip() for a in answers if isinstance(a, str) and a.strip())
+
+def index_version() -> int:
+    b = BUNDLE
+    return 0 if b is None else b.version
+
+def similar_cache_key(product_id: str, top_k: int, color_weight: float = 0.0):
+    return ("similar", index_version(), str(product_id), top_k, round(float(color_weight), 3))
 
-    # find index of product_id
-    matches = IDX_DF[IDX_DF['id'].astype(str) == str(product_id)]
-    if matches.empty:
+def quiz_cache_key(answers: List[str], gender: Optional[str], top_k: int,
+                   filters: Optional[Dict[str, Any]] = None):
+    norm_filters = tuple(sorted(
+        (col, tuple(sorted(v.lower() for v in ([vals] if isinstance(vals, str) else vals))))
+        for col, vals in (filters or {}).items() if vals
+    ))
+    return ("quiz", index_version(), tuple(a.lower() for a in normalize_answers(answers)),
+            (gender or "").strip().lower(), top_k, norm_filters)
+
+def _result_row(b: Bundle, i: int, score: float) -> Dict[str, Any]:
+    return {"id": b.ids[i], "image_path": b.image_paths[i], "score": score}
+
+def _full_row(b: Bundle, i: int, score: float) -> Dict[str, Any]:
+    """Result row with everything a response may need, read from precomputed arrays."""
+    row = _result_row(b, i, score)
+    row["url"] = b.public_paths[i]
+    row["metadata"] = {c: v[i] for c, v in b.meta_columns.items()}
+    row["attributes"] = {c: b.attr_values[c][codes[i]] for c, codes in b.attr_codes.items()}
+    return row
+
+def _search(b: Bundle, queries: np.ndarray, k: int):
+    """
+    Run one neighbour search for a (n_queries, D) block of normalized vectors.
+    Uses cluster-routed search when enabled, then the NN index when available
+    (see services/ann_index.py), otherwise exact search: rows are normalized
+    so cosine is a dot product.
+    """
+    k = min(k, b.embs.shape[0])
+    if b.cluster_index is not None:
+        return b.cluster_index.search(queries, k)
+    if b.nn is not None:
+        return b.nn.search(queries, k)
+    return topk(dot_scores(b.embs, queries), k)
+
+def _collect(b: Bundle, product_id: str, scores, indices, top_k: int) -> List[Dict[str, Any]]:
+    """Turn one row of search output into result dicts, dropping the query item itself."""
+    results = []
+    for s, i in zip(scores, indices):
+        if i < 0 or b.ids[i] == product_id:
+            continue
+        results.append(_result_row(b, i, float(s)))
+        if len(results) >= top_k:
+            break
+    return results
+
+def _blend_color(b: Bundle, idx: int, scores: np.ndarray, indices: np.ndarray, color_weight: float):
+    """
+    Re-rank one row of search output by (1 - w) * visual + w * color similarity.
+    Color similarity is a dot product of precomputed descriptors, one small
+    matrix-vector product over the candidates.
+    """
+    valid = indices >= 0
+    cand = indices[valid]
+    color_sim = np.asarray(b.colors[cand], dtype=np.float32) @ np.asarray(b.colors[idx], dtype=np.float32)
+    blended = (1.0 - color_weight) * scores[valid] + color_weight * color_sim
+    order = np.argsort(-blended, kind="stable")
+    return blended[order], cand[order]
+
+def _neighbors(b: Bundle, row: int, n: int):
+    """
+    (scores, positions) of the n nearest neighbours of catalog row `row`: a
+    slice of the precomputed neighbour table when it holds enough, otherwise
+    a live search.
+    """
+    table = b.neighbors
+    if table is not None and n - 1 <= table.k:
+        # a live search spends one of the n on the row itself; the table leaves it out
+        return table.lookup(row, n - 1)
+    scores, indices = _search(b, b.embs[row:row+1], n)
+    return scores[0], indices[0]
+
+def _similar(b: Bundle, product_id: str, top_k: int, color_weight: float = 0.0) -> List[Dict[str, Any]]:
+    # find index of product_id (O(1) hash lookup)
+    idx = b.id_to_pos.get(product_id)
+    if idx is None:
         return []
 
-    idx = int(matches.index[0])
-    emb = EMBS[idx:idx+1]
-
-    # if NN index available, use it (sklearn NearestNeighbors)
-    if NN is not None:
-        distances, indices = NN.kneighbors(emb, n_neighbors=min(top_k+1, EMBS.shape[0]))
-        results = []
-        for d, i in zip(distances[0], indices[0]):
-            pid = str(IDX_DF.iloc[i]['id'])
-            if pid == str(product_id):
-                continue
-            results.append({
-                "id": pid,
-                "image_path": IDX_DF.iloc[i].get("image_path", ""),
-                "score": float(1 - d)  # sklearn returns distance depending on metric; we use (1 - distance) as score
-            })
-            if len(results) >= top_k:
-                break
-        return results
-    else:
-        # fallback: compute cosine similarity brute-force
-        sims = cosine_similarity(EMBS, emb).reshape(-1)
-        # get top indices
-        order = np.argsort(-sims)  # descending
-        results = []
-        for i in order:
-            pid = str(IDX_DF.iloc[i]['id'])
-            if pid == str(product_id):
-                continue
-            results.append({
-                "id": pid,
-                "image_path": IDX_DF.iloc[i].get("image_path", ""),
-                "score": float(sims[i])
-            })
-            if len(results) >= top_k:
-                break
-        return results
-
-def recommend_by_quiz(answers: List[str], gender: Optional[str] = None, top_k: int = 10) -> Dict[str, Any]:
+    t = metrics.StageTimer("similar")
+    blend = color_weight > 0 and b.colors is not None
+    # + 1 because the query item is usually its own nearest neighbour; with
+    # color, widen the visual candidate pool and let color re-order it
+    scores, indices = _neighbors(b, idx, top_k * (max(1, config.COLOR_RERANK_FACTOR) if blend else 1) + 1)
+    t.lap("search")
+    if blend:
+        scores, indices = _blend_color(b, idx, scores, indices, color_weight)
+        t.lap("color_rerank")
+    results = _collect(b, product_id, scores, indices, top_k)
+    t.lap("rows")
+    return results
+
+def recommend_similar(product_id: str, top_k: int = 10, color_weight: float = 0.0) -> List[Dict[str, Any]]:
+    """
+    Return top_k visually similar items to the product_id.
+    With color_weight in (0, 1] the score blends in color similarity from the
+    precomputed color index (ignored when no color index is loaded).
+    Neighbours come from the precomputed neighbour table when it has enough.
+    """
+    return _similar(_live(), str(product_id), top_k, color_weight)
+
+def recommend_similar_batch(product_ids: List[str], top_k: int = 10,
+                            top_k_by_id: Optional[Dict[str, int]] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Batched recommend_similar: ids covered by the neighbour table are sliced
+    from it; the rest are searched with a single matrix-matrix product (or
+    one index call with many rows) at the largest requested k, then trimmed
+    per id. Unknown ids map to an empty list.
+    """
+    b = _live()
+    top_k_by_id = {str(k): v for k, v in (top_k_by_id or {}).items()}
+    out: Dict[str, List[Dict[str, Any]]] = {}
+    known: List[str] = []
+    for pid in dict.fromkeys(str(p) for p in product_ids):
+        out[pid] = []
+        if pid in b.id_to_pos:
+            known.append(pid)
+    if not known:
+        return out
+
+    t = metrics.StageTimer("similar_batch")
+    ks = {pid: top_k_by_id.get(pid, top_k) for pid in known}
+    table = b.neighbors
+    live = []
+    for pid in known:
+        if table is not None and ks[pid] <= table.k:
+            scores, indices = table.lookup(b.id_to_pos[pid], ks[pid])
+            out[pid] = _collect(b, pid, scores, indices, ks[pid])
+        else:
+            live.append(pid)
+    t.lap("table")
+    if not live:
+        return out
+    positions = np.fromiter((b.id_to_pos[pid] for pid in live), dtype=np.int64, count=len(live))
+    scores, indices = _search(b, b.embs[positions], max(ks[pid] for pid in live) + 1)
+    t.lap("search")
+    for row, pid in enumerate(live):
+        out[pid] = _collect(b, pid, scores[row], indices[row], ks[pid])
+    t.lap("rows")
+    return out
+
+def image_model() -> Optional[str]:
+    """
+    Name of the extractor the live catalog embeddings were made with; None if
+    unknown or if the manifest doesn't match them (image queries unavailable).
+    """
+    b = BUNDLE
+    if b is None or b.manifest is None or b.manifest_error:
+        return None
+    return b.manifest.get("model")
+
+def image_unavailable_reason() -> str:
+    """Why image_model() is None, for the 503 of /by-image."""
+    b = BUNDLE
+    if b is not None and b.manifest_error:
+        return (f"catalog embeddings don't match their manifest ({b.manifest_error}); "
+                f"rerun data/scripts/extract_embeddings.py")
+    return "catalog embeddings have no manifest; rerun data/scripts/extract_embeddings.py"
+
+def recommend_by_vector(vector: np.ndarray, top_k: int = 10) -> List[Dict[str, Any]]:
+    """
+    Return the top_k catalog items closest to an arbitrary embedding, e.g.
+    one computed from an uploaded photo. vector must live in the same space
+    as the catalog embeddings.
+    """
+    b = _live()
+    q = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+    if q.shape[1] != b.embs.shape[1]:
+        raise ValueError(f"query has {q.shape[1]} dims, catalog embeddings have {b.embs.shape[1]}")
+    norm = np.linalg.norm(q)
+    if norm > 0:
+        q /= norm
+    t = metrics.StageTimer("by_vector")
+    scores, indices = _search(b, q, top_k)
+    t.lap("search")
+    results = _collect(b, None, scores[0], indices[0], top_k)
+    t.lap("rows")
+    return results
+
+def recommend_by_quiz(answers: List[str], gender: Optional[str] = None, top_k: int = 10,
+                      filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Strategy:
+     0) Restrict the catalog with gender / attribute `filters` as a boolean mask.
      1) Use TF-IDF vectorizer to find top text-matching candidates.
      2) From these candidates, use image embeddings to find visually close items (NN).
      3) Return top_k ranked by combined score.
     """
+    b = _live()
     # Step 0: basic sanity
-    if TFIDF_MATRIX is None or VECTORIZER is None:
+    if b.tfidf is None or b.vectorizer is None:
         # no text model — fallback to returning top visual cluster centers or random
         logger.warning("No text vectorizer available; falling back to visual-only recommendations.")
         # Return top_k items from a random seed or cluster (simple)
-        ids = IDX_DF['id'].astype(str).tolist()
-        picks = ids[:top_k]
-        return {"results": [{"id": pid, "image_path": IDX_DF[IDX_DF['id'].astype(str) == pid].iloc[0].get("image_path",""), "score": 0.0} for pid in picks],
-                "used_text_candidates": 0, "used_visual_candidates": len(picks)}
+        picks = range(min(top_k, len(b.ids)))
+        return {"results": [_full_row(b, i, 0.0) for i in picks],
+                "used_text_candidates": 0, "used_visual_candidates": len(picks), "filters_relaxed": False}
+
+    t = metrics.StageTimer("by_quiz")
+    # cosine similarity with the TF-IDF rows, for the rows sharing a term with
+    # the query. Known quiz answers are composed from precomputed vectors;
+    # anything else is vectorized and scored from the postings of its terms
+    # (see services/text_index.py).
+    answers = normalize_answers(answers)
+    matched = b.answer_vectors.scores(answers) if b.answer_vectors is not None else None
+    if matched is None:
+        q_vec = b.vectorizer.transform([" ".join(answers)])  # shape (1, V)
+        matched = b.text_index.scores(q_vec.indices, q_vec.data)
+    t.lap("text_scores")
 
-    query_text = " ".join([a for a in answers if isinstance(a, str)])
-    q_vec = VECTORIZER.transform([query_text])  # shape (1, V)
+    # Gender / attribute filters are applied as a mask before candidate selection.
+    # If nothing in the catalog matches all of them, the attribute filters are
+    # dropped but gender is kept; if the gender alone matches nothing either
+    # (unknown value, or absent from this catalog) no filter is applied, as
+    # before. Either way the result says filters_relaxed.
+    all_filters = dict(filters or {})
+    if gender and gender_values(gender):
+        all_filters["gender"] = list(gender_values(gender))
+    mask = attribute_mask(b, all_filters) if all_filters else None
+    filters_relaxed = False
+    if mask is not None and not mask.any():
+        filters_relaxed = True
+        mask = attribute_mask(b, {"gender": all_filters["gender"]}) if "gender" in all_filters else None
+        if mask is not None and not mask.any():
+            mask = None
+    t.lap("filter_mask")
 
-    # compute cosine similarity between q_vec and TFIDF_MATRIX
-    text_sim = (TFIDF_MATRIX @ q_vec.T).toarray().reshape(-1)  # dot product approximates similarity
     # get top M text candidates (more than top_k to give visual re-ranking)
     M = max(200, top_k * 20)
-    candidate_idxs = np.argsort(-text_sim)[:M]
-    candidate_ids = IDX_DF.iloc[candidate_idxs]['id'].astype(str).tolist()
-
-    # If gender filtering requested and metadata has gender-like column, filter candidates
-    if gender:
-        gender_cols = [c for c in IDX_DF.columns if 'gender' in c.lower() or 'usage' in c.lower()]
-        if gender_cols:
-            keep = []
-            for ci in candidate_idxs:
-                row = IDX_DF.iloc[ci]
-                # basic match: if any gender column contains the requested gender string
-                if any(str(row.get(gc,"")).lower().find(gender.lower()) != -1 for gc in gender_cols):
-                    keep.append(ci)
-            if keep:
-                candidate_idxs = keep
-                candidate_ids = IDX_DF.iloc[candidate_idxs]['id'].astype(str).tolist()
+    cand_scores, candidate_idxs = b.text_index.select(*matched, M, allowed=mask)
+    if len(candidate_idxs) < M:
+        # too few text matches: fill up with unmatched items (text score 0) so
+        # visual re-ranking still has top_k to choose from
+        allowed = np.flatnonzero(mask) if mask is not None else np.arange(len(b.ids))
+        head = allowed[:2 * M]
+        fill = head[~np.isin(head, candidate_idxs)][:M - len(candidate_idxs)]
+        candidate_idxs = np.concatenate([candidate_idxs, fill])
+        cand_scores = np.concatenate([cand_scores, np.zeros(len(fill))])
+    t.lap("text_topk")
 
     # Visual re-ranking: compute similarity of candidate embeddings to a "query embedding"
     # Option 1: compute average embedding of top text candidates and find neighbors
-    emb_candidates = EMBS[candidate_idxs]
-    query_emb = emb_candidates.mean(axis=0, keepdims=True)
+    emb_candidates = b.embs[candidate_idxs]
+    query_emb = emb_candidates.mean(axis=0, keepdims=True, dtype=np.float32)
+    norm = np.linalg.norm(query_emb)
+    if norm > 0:
+        query_emb /= norm
     # Use NN to get final ordering among full index (or among candidates only)
-    # We'll compute cosine similarity between query_emb and candidate embeddings
-    sims = cosine_similarity(emb_candidates, query_emb).reshape(-1)
-    # combine text_sim (normalized) and visual sims with weights
-    tnorm = (text_sim[candidate_idxs] - text_sim[candidate_idxs].min())
+    # Candidate rows are unit length, so the dot product with the normalized
+    # query embedding is their cosine similarity
+    sims = dot_scores(emb_candidates, query_emb).reshape(-1)
+    # combine text scores (normalized) and visual sims with weights
+    tnorm = (cand_scores - cand_scores.min())
     if tnorm.max() > 0:
         tnorm = tnorm / tnorm.max()
     vnorm = (sims - sims.min())
@@ -134,17 +538,11 @@ def recommend_by_quiz(answers: List[str], gender: Optional[str] = None, top_k: i
         vnorm = vnorm / vnorm.max()
     alpha = 0.45  # weight for text, 0.55 for visual (tune later)
     combined = alpha * tnorm + (1 - alpha) * vnorm
-    order = np.argsort(-combined)
+    _, order = topk(combined[None, :], top_k)
+    t.lap("visual_rerank")
 
-    results = []
-    for oi in order[:top_k]:
-        idx_global = candidate_idxs[oi]
-        pid = str(IDX_DF.iloc[idx_global]['id'])
-        results.append({
-            "id": pid,
-            "image_path": IDX_DF.iloc[idx_global].get("image_path", ""),
-            "score": float(combined[oi]),
-            "metadata": IDX_DF.iloc[idx_global].to_dict()
-        })
-
-    return {"results": results, "used_text_candidates": len(candidate_idxs), "used_visual_candidates": len(results)}
+    results = [_full_row(b, candidate_idxs[oi], float(combined[oi])) for oi in order[0]]
+    t.lap("rows")
+
+    return {"results": results, "used_text_candidates": len(candidate_idxs), "used_visual_candidates": len(results),
+            "filters_relaxed": filters_relaxed}
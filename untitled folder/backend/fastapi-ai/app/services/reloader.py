@@ -0,0 +1,151 @@
+# backend/fastapi-ai/app/services/reloader.py
+"""
+Hot reload of recommender artifacts.
+
+A reload loads a complete new set of artifacts in a background thread,
+builds and validates a recommender.Bundle from them, and only then swaps
+it in with a single reference assignment. Requests already running keep
+the bundle they started with; a failed load leaves the live bundle alone.
+
+Reloads are triggered by POST /api/recommend/admin/reload or, when
+ARTIFACT_WATCH_INTERVAL_S > 0, by a watcher thread that polls the
+artifact files for a changed mtime/size. After a failed reload the watcher
+retries only once the files change again.
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from ..utils import loader
+from . import recommender
+
+logger = logging.getLogger(__name__)
+
+
+class ArtifactReloader:
+    def __init__(self):
+        # guards _busy only; never held while artifacts load, so status checks
+        # and reload_in_background() return immediately during a reload
+        self._state_lock = threading.Lock()
+        self._busy = False
+        self._thread: Optional[threading.Thread] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.signature = None
+        # on-disk state of the last failed reload; the watcher waits for the
+        # files to change again instead of retrying the same broken set
+        self.failed_signature = None
+        self.state = "idle"
+        self.last_error: Optional[str] = None
+        self.last_reload_at: Optional[float] = None
+        self.last_duration_s: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._busy
+
+    def _claim(self) -> bool:
+        with self._state_lock:
+            if self._busy:
+                return False
+            self._busy = True
+            return True
+
+    def _release(self):
+        with self._state_lock:
+            self._busy = False
+
+    def reload(self) -> bool:
+        """
+        Load, validate and swap synchronously. Returns True if a new bundle
+        went live, False if the load failed or another reload is running.
+        """
+        if not self._claim():
+            return False
+        try:
+            return self._load()
+        finally:
+            self._release()
+
+    def _load(self) -> bool:
+        self.state = "loading"
+        start = time.perf_counter()
+        # taken before loading, so files changing mid-load trigger another reload
+        signature = loader.artifact_signature()
+        try:
+            resources = loader.load_resources()
+            bundle = recommender.build_bundle(resources, recommender.next_version())
+            self.state = "validating"
+            recommender.validate_bundle(bundle)
+            recommender.swap(bundle)
+        except Exception as e:
+            logger.exception("Artifact reload failed; keeping the current bundle")
+            self.state = "failed"
+            self.last_error = str(e)
+            self.failed_signature = signature
+            return False
+        finally:
+            self.last_duration_s = time.perf_counter() - start
+        self.signature = signature
+        self.failed_signature = None
+        self.state = "idle"
+        self.last_error = None
+        self.last_reload_at = time.time()
+        return True
+
+    def _load_in_thread(self):
+        try:
+            self._load()
+        finally:
+            self._release()
+
+    def reload_in_background(self) -> bool:
+        """Start a reload thread. Returns False if a reload is already running."""
+        if not self._claim():
+            return False
+        self._thread = threading.Thread(target=self._load_in_thread, name="artifact-reload", daemon=True)
+        self._thread.start()
+        return True
+
+    def mark_loaded(self):
+        """Record the on-disk state the startup load corresponds to."""
+        self.signature = loader.artifact_signature()
+        self.last_reload_at = time.time()
+
+    def start_watching(self, interval_s: float):
+        if interval_s <= 0 or self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval_s,), name="artifact-watch", daemon=True)
+        self._watcher.start()
+        logger.info(f"Watching artifacts for changes every {interval_s}s")
+
+    def stop_watching(self):
+        self._stop.set()
+        self._watcher = None
+
+    def _watch(self, interval_s: float):
+        while not self._stop.wait(interval_s):
+            try:
+                if self.running:
+                    continue
+                signature = loader.artifact_signature()
+                if signature != self.signature and signature != self.failed_signature:
+                    logger.info("Artifact change detected on disk; reloading")
+                    self.reload()
+            except Exception:
+                logger.exception("Artifact watcher error")
+
+    def status(self) -> Dict[str, Any]:
+        b = recommender.BUNDLE
+        return {
+            "state": "loading" if self.running and self.state == "idle" else self.state,
+            "live": b.describe() if b is not None else None,
+            "last_reload_at": self.last_reload_at,
+            "last_duration_s": self.last_duration_s,
+            "last_error": self.last_error,
+        }
+
+
+reloader = ArtifactReloader()
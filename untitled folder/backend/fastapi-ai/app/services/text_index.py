@@ -0,0 +1,173 @@
+# backend/fastapi-ai/app/services/text_index.py
+"""
+Inverted index over the TF-IDF matrix for quiz text retrieval.
+
+The matrix is kept column-wise (CSC): for every term, the catalog rows that
+contain it and their TF-IDF weights, i.e. the term's postings list. A quiz
+query has a handful of non-zero terms, so scoring gathers only those
+postings and sums them per row, instead of multiplying every catalog row
+with the query, and top-M selection runs over the rows that matched rather
+than over the whole catalog.
+
+For every matched row the score equals (tfidf @ q.T)[row]; rows sharing no
+term with the query score 0 and are not returned.
+"""
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .ann_index import topk
+
+
+class InvertedIndex:
+    # below this many postings per catalog row, matched rows are found by
+    # sorting the postings; above it a dense accumulator is cheaper
+    SPARSE_FRACTION = 8
+
+    def __init__(self, tfidf):
+        from scipy import sparse
+        csc = sparse.csc_matrix(tfidf)
+        self.n_rows, self.n_terms = csc.shape
+        self.indptr = csc.indptr
+        self.postings = csc.indices.astype(np.int32, copy=False)
+        self.weights = csc.data
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    @property
+    def nnz(self) -> int:
+        return len(self.postings)
+
+    def scores(self, terms: np.ndarray, term_weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (rows, scores) for the rows that share at least one term with the
+        query given as parallel arrays of term ids and query weights.
+        """
+        lo, hi = self.indptr[terms], self.indptr[np.asarray(terms) + 1]
+        if len(lo) == 0:
+            return self.accumulate([], [])
+        return self.accumulate([self.postings[a:b] for a, b in zip(lo, hi)],
+                               [w * self.weights[a:b] for a, b, w in zip(lo, hi, term_weights)])
+
+    def accumulate(self, row_parts, value_parts) -> Tuple[np.ndarray, np.ndarray]:
+        """Sum lists of (rows, values) arrays per row -> (matched rows, scores)."""
+        rows = np.concatenate(row_parts) if len(row_parts) else np.empty(0, dtype=np.int32)
+        if len(rows) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        vals = np.concatenate(value_parts)
+        if len(rows) * self.SPARSE_FRACTION <= self.n_rows:
+            matched, inverse = np.unique(rows, return_inverse=True)
+            return matched.astype(np.int64), np.bincount(inverse, weights=vals)
+        acc = np.bincount(rows, weights=vals, minlength=self.n_rows)
+        matched = np.flatnonzero(acc)
+        return matched, acc[matched]
+
+    def search(self, q_vec, m: int, allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-m rows for a (1, n_terms) sparse query vector (vectorizer output),
+        as (scores, rows) sorted best first. `allowed` is an optional boolean
+        mask over rows; rows outside it are never returned.
+        """
+        q = q_vec.tocsr()
+        return self.select(*self.scores(q.indices, q.data), m, allowed=allowed)
+
+    def select(self, rows: np.ndarray, scores: np.ndarray, m: int,
+               allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Partial top-m of scored rows (from scores() or AnswerVectors.scores()), best first."""
+        if allowed is not None and len(rows):
+            keep = allowed[rows]
+            rows, scores = rows[keep], scores[keep]
+        top_scores, order = topk(scores[None, :], m)
+        return top_scores[0], rows[order[0]]
+
+
+class _Answer(NamedTuple):
+    terms: np.ndarray       # term ids
+    raw: np.ndarray         # tf * idf, not normalized
+    first: Optional[str]    # first / last token, for bigrams across answers
+    last: Optional[str]
+    rows: np.ndarray        # rows matched by the answer's terms
+    scores: np.ndarray      # tfidf[rows] @ raw
+
+
+class AnswerVectors:
+    """
+    Query vectors and text scores precomputed for a fixed answer vocabulary:
+    the option texts and aesthetics of the quiz (node-api quizController,
+    exported by data/scripts/export_quiz_answers.py).
+
+    vectorizer.transform([" ".join(answers)]) is the L2-normalized sum of each
+    answer's raw (tf * idf) vector plus the bigrams spanning two neighbouring
+    answers. For every known answer we keep its raw term weights, its first and
+    last token and its raw score contribution (tfidf @ raw, as matched rows), so
+    a request adds these up sparsely, adds the few boundary bigrams from the
+    postings and divides by the norm once; no tokenization, and most of the
+    scoring was done at load time. Queries with an unknown answer return None
+    and go through the vectorizer.
+    """
+
+    def __init__(self, vectorizer, index: InvertedIndex, answers: Iterable[str]):
+        from sklearn.feature_extraction.text import CountVectorizer
+        self.index = index
+        self._vocabulary = vectorizer.vocabulary_
+        self._idf = vectorizer.idf_
+        self._bigrams = vectorizer.ngram_range[1] >= 2
+        self._preprocess = vectorizer.build_preprocessor()
+        tokenize = vectorizer.build_tokenizer()
+        keys = sorted({self._preprocess(a) for a in answers if isinstance(a, str) and a.strip()})
+        counts = CountVectorizer.transform(vectorizer, keys).tocsr() if keys else None
+        self._parts: Dict[str, _Answer] = {}
+        for i, key in enumerate(keys):
+            row = counts.getrow(i)
+            terms, raw = row.indices, row.data * self._idf[row.indices]
+            tokens = tokenize(key)
+            self._parts[key] = _Answer(terms, raw, tokens[0] if tokens else None, tokens[-1] if tokens else None,
+                                       *index.scores(terms, raw))
+
+    @staticmethod
+    def supports(vectorizer) -> bool:
+        """Composition is exact only for plain word n-grams (n <= 2), raw tf and l2 norm."""
+        return (vectorizer.analyzer == "word" and vectorizer.ngram_range[1] <= 2 and vectorizer.norm == "l2"
+                and not vectorizer.sublinear_tf and vectorizer.stop_words is None)
+
+    def __len__(self) -> int:
+        return len(self._parts)
+
+    def scores(self, answers: List[str]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        (rows, scores) equal to InvertedIndex.scores() of the vectorized
+        " ".join(answers), or None if an answer is not in the vocabulary.
+        """
+        parts = []
+        for a in answers:
+            part = self._parts.get(self._preprocess(a))
+            if part is None:
+                return None
+            parts.append(part)
+        if not parts:
+            return self.index.accumulate([], [])
+        terms = [p.terms for p in parts]
+        weights = [p.raw for p in parts]
+        row_parts = [p.rows for p in parts]
+        value_parts = [p.scores for p in parts]
+        if self._bigrams:
+            # " ".join() creates one bigram between neighbouring answers that have tokens
+            spans = [p for p in parts if p.first is not None]
+            for prev, nxt in zip(spans, spans[1:]):
+                term = self._vocabulary.get(f"{prev.last} {nxt.first}")
+                if term is None:
+                    continue
+                weight = self._idf[term]
+                lo, hi = self.index.indptr[term], self.index.indptr[term + 1]
+                terms.append(np.array([term]))
+                weights.append(np.array([weight]))
+                row_parts.append(self.index.postings[lo:hi])
+                value_parts.append(weight * self.index.weights[lo:hi])
+        all_terms = np.concatenate(terms)
+        if len(all_terms) == 0:
+            return self.index.accumulate([], [])
+        _, inverse = np.unique(all_terms, return_inverse=True)
+        norm = np.sqrt(np.square(np.bincount(inverse, weights=np.concatenate(weights))).sum())
+        rows, scores = self.index.accumulate(row_parts, value_parts)
+        return rows, scores / norm
@@ -1,4 +1,5 @@
-import os, json, pickle
+import os, json, pickle, sys, threading, time
+from collections import OrderedDict
 
 def ensure_dir(path: str):
     os.makedirs(path, exist_ok=True)
@@ -11,3 +12,77 @@ def save_pickle(obj, path: str):
 def load_pickle(path: str):
     with open(path, 'rb') as f:
         return pickle.load(f)
+
+
+def approx_size(obj) -> int:
+    """Rough deep size in bytes of plain result data (dict/list/tuple/str/numbers)."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approx_size(k) + approx_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(approx_size(v) for v in obj)
+    return size
+
+
+class TTLCache:
+    """
+    In-process LRU cache with per-entry TTL and a total size budget in bytes.
+    Values are stored by reference, so callers must not mutate what they get back.
+    """
+
+    def __init__(self, max_bytes: int, ttl_s: float):
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._data = OrderedDict()   # key -> (expires_at, size, value)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.ttl_s > 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        size = approx_size(key) + approx_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            while self._data and self.bytes + size > self.max_bytes:
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+            self._data[key] = (time.monotonic() + self.ttl_s, size, value)
+            self.bytes += size
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def _drop(self, key):
+        _, size, _ = self._data.pop(key)
+        self.bytes -= size
+
+    def stats(self) -> dict:
+        return {"entries": len(self._data), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
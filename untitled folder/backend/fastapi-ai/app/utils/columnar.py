@@ -0,0 +1,119 @@
+# backend/fastapi-ai/app/utils/columnar.py
+"""
+Columnar table store for catalog metadata and the embedding index map.
+
+A table is a directory with one .npy file per column plus schema.json:
+  - "category" columns (few distinct values: gender, articleType, ...) are
+    int16/int32 codes + the list of categories in the schema,
+  - "string" columns (ids, names, image keys) are fixed-width UTF-8 bytes.
+Every value is a string, exactly as the CSV loader (dtype=str, NaN -> "")
+sees it, so both sources produce the same DataFrame contents.
+
+Columns are memory-mapped on load. Category columns become pandas
+Categoricals over the mapped codes, so no per-row Python str is created,
+and callers can skip string columns they don't need. schema.json records a
+content hash of all columns, used to tell whether derived artifacts (the
+TF-IDF index) are stale.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_FNAME = "schema.json"
+FORMAT_VERSION = 1
+
+# object columns with at most this many distinct values (and fewer than half
+# the rows) are dictionary-encoded
+MAX_CATEGORIES = 4096
+
+
+def _encode(values: pd.Series, kind: str):
+    """Return (array, extra schema fields) for one column of strings."""
+    if kind == "category":
+        cat = pd.Categorical(values)
+        dtype = np.int16 if len(cat.categories) < np.iinfo(np.int16).max else np.int32
+        return cat.codes.astype(dtype), {"categories": [str(c) for c in cat.categories]}
+    encoded = values.str.encode("utf-8")
+    width = max(1, int(encoded.str.len().max() or 0))
+    return np.array(encoded.tolist(), dtype=f"S{width}"), {}
+
+
+def write_table(df: pd.DataFrame, out_dir: str, string_columns: Iterable[str] = ("id",)) -> str:
+    """
+    Write df as a columnar table at out_dir and return its content hash.
+    Columns named in string_columns are never dictionary-encoded. The table
+    is written to a sibling temp directory and swapped in, so readers never
+    see a half-written table.
+    """
+    string_columns = set(string_columns)
+    df = df.fillna("").astype(str)
+    tmp = f"{out_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    h = hashlib.sha256()
+    columns = []
+    for i, name in enumerate(df.columns):
+        values = df[name]
+        n_unique = values.nunique()
+        kind = ("category" if name not in string_columns and n_unique <= MAX_CATEGORIES
+                and n_unique < max(2, len(df) // 2) else "string")
+        arr, extra = _encode(values, kind)
+        fname = f"col_{i:03d}.npy"
+        np.save(os.path.join(tmp, fname), arr)
+        h.update(name.encode() + b"\0" + kind.encode() + arr.tobytes() + json.dumps(extra).encode())
+        columns.append({"name": name, "kind": kind, "file": fname, **extra})
+    schema = {"format": FORMAT_VERSION, "rows": len(df), "columns": columns, "content_hash": h.hexdigest()}
+    with open(os.path.join(tmp, SCHEMA_FNAME), "w") as f:
+        json.dump(schema, f)
+    old = f"{out_dir}.old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old)
+    os.replace(tmp, out_dir)
+    shutil.rmtree(old, ignore_errors=True)
+    logger.info(f"Wrote columnar table {out_dir}: {len(df)} rows, "
+                f"{sum(c['kind'] == 'category' for c in columns)}/{len(columns)} categorical columns")
+    return schema["content_hash"]
+
+
+def read_schema(path: str) -> dict:
+    with open(os.path.join(path, SCHEMA_FNAME)) as f:
+        schema = json.load(f)
+    if schema.get("format") != FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported columnar format {schema.get('format')}")
+    return schema
+
+
+def read_table(path: str, columns: Optional[Iterable[str]] = None, skip_strings: bool = False,
+               keep: Iterable[str] = ("id",), mmap: bool = True) -> pd.DataFrame:
+    """
+    Load a table written by write_table(). `columns` limits which columns are
+    read; with skip_strings, string columns other than those in `keep` are
+    left out (they are the only ones that cost a Python object per row).
+    """
+    schema = read_schema(path)
+    wanted = None if columns is None else set(columns)
+    keep = set(keep)
+    data = {}
+    for col in schema["columns"]:
+        name = col["name"]
+        if wanted is not None and name not in wanted:
+            continue
+        if skip_strings and col["kind"] == "string" and name not in keep:
+            continue
+        arr = np.load(os.path.join(path, col["file"]), mmap_mode="r" if mmap else None)
+        if col["kind"] == "category":
+            data[name] = pd.Categorical.from_codes(arr, categories=col["categories"], validate=False)
+        else:
+            data[name] = np.char.decode(arr, "utf-8").astype(object)
+    df = pd.DataFrame(data)
+    df.attrs["partial"] = len(data) < len(schema["columns"])
+    return df
@@ -0,0 +1,123 @@
+# backend/fastapi-ai/app/utils/executor.py
+"""
+Bounded thread pool for CPU-bound recommender calls.
+
+Async route handlers submit work here instead of relying on Starlette's
+default threadpool, which gives us:
+  - a fixed number of worker threads,
+  - a cap on queued work; beyond it requests are rejected with Overloaded
+    so the route can shed load (503 + Retry-After),
+  - a per-request deadline; work that is still queued when the deadline
+    passes is dropped, and the caller gets DeadlineExceeded,
+  - BLAS threads limited so (worker threads x BLAS threads) fits the cores.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUE_WAIT_SECONDS = metrics.histogram("reco_pool_queue_wait_seconds",
+                                       "Time a task waited for a recommender pool thread")
+
+
+class Overloaded(Exception):
+    """Raised when the pool already holds max_workers + max_queue tasks."""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a task did not finish within its deadline."""
+
+
+class RecommenderPool:
+    def __init__(self, max_workers: int, max_queue: int, blas_threads: Optional[int] = None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.blas_threads = blas_threads
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0      # queued + running
+        self.rejected = 0
+        self.timed_out = 0
+
+    def start(self):
+        if self._pool is not None:
+            return
+        if self.blas_threads:
+            try:
+                from threadpoolctl import threadpool_limits
+                threadpool_limits(limits=self.blas_threads)
+            except ImportError:
+                logger.warning("threadpoolctl not installed; BLAS thread count left unchanged")
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="recommender")
+        logger.info(f"Recommender pool started: workers={self.max_workers} max_queue={self.max_queue} "
+                    f"blas_threads={self.blas_threads}")
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @property
+    def queued(self) -> int:
+        return max(0, self._pending - self.max_workers)
+
+    def _release(self, _fut):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn: Callable, *args, deadline_s: Optional[float] = None, **kwargs):
+        """
+        Run fn(*args, **kwargs) on the pool and await its result.
+        Raises Overloaded immediately if the queue is full, DeadlineExceeded
+        if the result is not ready within deadline_s seconds.
+        """
+        if self._pool is None:
+            self.start()
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise Overloaded()
+            self._pending += 1
+
+        submitted = time.monotonic()
+        expires = submitted + deadline_s if deadline_s else None
+
+        def _task():
+            QUEUE_WAIT_SECONDS.observe(time.monotonic() - submitted)
+            # skip work whose caller has already given up while it sat in the queue
+            if expires is not None and time.monotonic() > expires:
+                raise DeadlineExceeded()
+            return fn(*args, **kwargs)
+
+        try:
+            cfut = self._pool.submit(_task)
+        except Exception:
+            self._release(None)
+            raise
+        # the slot is freed when the thread is done, not when the caller stops waiting
+        cfut.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(cfut), timeout=deadline_s)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise DeadlineExceeded()
+
+
+def default_blas_threads(max_workers: int) -> int:
+    return max(1, (os.cpu_count() or 1) // max(1, max_workers))
+
+
+def make_pool(max_workers: int, max_queue: int, blas_threads: int = 0) -> RecommenderPool:
+    return RecommenderPool(max_workers, max_queue, blas_threads or default_blas_threads(max_workers))
+
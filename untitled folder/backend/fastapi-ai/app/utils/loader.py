@@ -1,11 +1,20 @@
 # backend/fastapi-ai/app/utils/loader.py
 import os
+import hashlib
+import json
+import time
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Dict, List, Optional
 import numpy as np
 import pandas as pd
 import joblib
 import logging
 
+from .. import config
+from ..services import ann_index, embedding
+from . import columnar
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
@@ -13,12 +22,35 @@ logger.setLevel(logging.INFO)
 # app/utils -> app (1) -> fastapi-ai (2) -> backend (3) -> fashion-recommendation-app (4)
 DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../../data/processed"))
 
-# Expected filenames (adjust if yours differ)
+# Expected filenames (adjust if yours differ). The two CSVs may have a columnar
+# twin (<name>.cols/, see utils/columnar.py) which is read instead when present.
 METADATA_FNAME = "metadata_clean.csv"
 EMBEDDINGS_FNAME = "embeddings.npy"
+EMB_CACHE_FNAME = "embeddings.norm.{dtype}.npy"  # normalized serving copy, derived from EMBEDDINGS_FNAME
 EMB_INDEX_FNAME = "embeddings_index.csv"
+EMB_MANIFEST_FNAME = "embeddings.manifest.json"  # model/dim/preprocessing, written by extract_embeddings.py
 NN_INDEX_FNAME = "nn_index.pkl"
+ANN_INDEX_FNAME = "ann_index_{backend}"  # + backend suffix, written by build_index_and_clusters.py
 KMEANS_FNAME = "kmeans_model.pkl"
+TFIDF_FNAME = "tfidf_index.npz"  # written by data/scripts/build_text_index.py
+COLOR_INDEX_FNAME = "color_index.npy"  # written by data/scripts/build_color_index.py
+QUIZ_ANSWERS_FNAME = "quiz_answers.json"  # written by data/scripts/export_quiz_answers.py
+NEIGHBORS_DIRNAME = "neighbors"  # ann_index.NeighborTable, written by build_index_and_clusters.py
+
+# TfidfVectorizer settings; part of the TF-IDF artifact hash so changing them forces a rebuild
+TFIDF_PARAMS = {"max_features": 20000, "ngram_range": (1, 2)}
+
+# seconds spent in each phase of the most recent startup/reload, see timed()
+LOAD_TIMINGS: Dict[str, float] = {}
+
+@contextmanager
+def timed(phase: str):
+    """Record how long the block takes under LOAD_TIMINGS[phase]."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        LOAD_TIMINGS[phase] = time.perf_counter() - start
 
 def _resolve(path: str) -> str:
     p = os.path.join(DATA_DIR, path)
@@ -28,49 +60,245 @@ def _ensure_exists(path: str):
     if not os.path.exists(path):
         raise FileNotFoundError(f"{path} not found. Ensure preprocessing outputs are in {DATA_DIR}")
 
-def load_metadata(metadata_filename: str = METADATA_FNAME) -> pd.DataFrame:
+def _is_fresh(derived: str, source: str) -> bool:
+    return os.path.exists(derived) and os.path.getmtime(derived) >= os.path.getmtime(source)
+
+def table_name(csv_filename: str) -> str:
+    """Directory name of the columnar twin of a CSV artifact."""
+    return os.path.splitext(csv_filename)[0] + ".cols"
+
+def _columnar_source(csv_filename: str) -> Optional[str]:
+    """Path of the columnar table to read instead of csv_filename, or None to read the CSV."""
+    table = _resolve(table_name(csv_filename))
+    schema = os.path.join(table, columnar.SCHEMA_FNAME)
+    if not os.path.exists(schema):
+        return None
+    csv_path = _resolve(csv_filename)
+    if os.path.exists(csv_path) and not _is_fresh(schema, csv_path):
+        logger.warning(f"{table} is older than {csv_path}; reading the CSV instead "
+                       f"(rerun data/scripts/build_columnar.py)")
+        return None
+    return table
+
+def load_metadata(metadata_filename: str = METADATA_FNAME, skip_text: bool = False) -> pd.DataFrame:
+    """
+    Load catalog metadata, all values as strings. From the columnar table,
+    low-cardinality columns come back as Categoricals over memory-mapped codes,
+    and skip_text leaves out free-text columns (everything but 'id' that isn't
+    categorical); such a frame has attrs["partial"] set.
+    """
     logger.info(f"DATA_DIR resolved to: {DATA_DIR}")
+    table = _columnar_source(metadata_filename)
+    if table is not None:
+        df = columnar.read_table(table, skip_strings=skip_text)
+        logger.info(f"Loaded metadata: {table} ({len(df)} rows, {len(df.columns)} columns, columnar)")
+        return df
     path = _resolve(metadata_filename)
     _ensure_exists(path)
-    # Use pandas read_csv with python engine for robustness
-    df = pd.read_csv(path, dtype=str, engine="python", on_bad_lines="skip")
+    df = pd.read_csv(path, dtype=str, on_bad_lines="skip")
     df.fillna("", inplace=True)
     logger.info(f"Loaded metadata: {path} ({len(df)} rows)")
     return df
 
-def load_embeddings(emb_filename: str = EMBEDDINGS_FNAME) -> np.ndarray:
+def _write_normalized_cache(source: str, dest: str, dtype: np.dtype, block: int = 8192):
+    """
+    Write an L2-normalized copy of `source` to `dest` as a plain .npy file.
+    The source is read through mmap block by block, and the result is written
+    to a per-process temp file then renamed, so concurrent workers starting
+    together never observe a half-written cache.
+    """
+    raw = np.load(source, mmap_mode="r")
+    tmp = f"{dest}.{os.getpid()}.tmp"
+    out = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=raw.shape)
+    for start in range(0, raw.shape[0], block):
+        out[start:start + block] = ann_index.l2_normalize(raw[start:start + block], dtype=dtype)
+    out.flush()
+    del out
+    os.replace(tmp, dest)
+    logger.info(f"Wrote normalized embeddings cache: {dest}")
+
+def load_embeddings(emb_filename: str = EMBEDDINGS_FNAME, dtype: Optional[str] = None,
+                    mmap: Optional[bool] = None) -> np.ndarray:
+    """
+    Load the embedding matrix as an L2-normalized, C-contiguous array so that
+    cosine similarity is a plain dot product on the request path.
+    `dtype` (default: config.EMBEDDINGS_DTYPE) is "float32" or "float16".
+    With `mmap` (default: config.EMBEDDINGS_MMAP) the normalized matrix is
+    cached on disk once and memory-mapped read-only, so uvicorn workers share
+    it through the page cache instead of each holding a private copy.
+    """
+    dtype = np.dtype(dtype or config.EMBEDDINGS_DTYPE)
+    if dtype not in (np.float32, np.float16):
+        raise ValueError(f"Unsupported embeddings dtype '{dtype}'; use float32 or float16")
+    mmap = config.EMBEDDINGS_MMAP if mmap is None else mmap
     path = _resolve(emb_filename)
     _ensure_exists(path)
-    embs = np.load(path)
-    logger.info(f"Loaded embeddings: {path} shape={embs.shape}")
+
+    if mmap:
+        cache = _resolve(EMB_CACHE_FNAME.format(dtype=dtype.name))
+        try:
+            if not _is_fresh(cache, path):
+                _write_normalized_cache(path, cache, dtype)
+            # view as a plain ndarray so results of arithmetic are not memmaps
+            embs = np.load(cache, mmap_mode="r").view(np.ndarray)
+            logger.info(f"Memory-mapped embeddings: {cache} shape={embs.shape} dtype={embs.dtype}")
+            return embs
+        except OSError as e:
+            logger.warning(f"Could not use mmap embeddings cache {cache} ({e}); loading into memory")
+
+    raw = np.load(path, mmap_mode="r")
+    embs = ann_index.l2_normalize(raw, dtype=dtype)
+    logger.info(f"Loaded embeddings: {path} shape={embs.shape} dtype={embs.dtype} "
+                f"(source {raw.dtype}, {embs.nbytes / 1e6:.1f} MB resident)")
     return embs
 
+def load_manifest(manifest_filename: str = EMB_MANIFEST_FNAME) -> Optional[dict]:
+    path = _resolve(manifest_filename)
+    if not os.path.exists(path):
+        logger.warning(f"Embeddings manifest not found at {path}; online image queries are disabled "
+                       f"until data/scripts/extract_embeddings.py is rerun")
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    logger.info(f"Loaded embeddings manifest: {path} (model={manifest.get('model')} dim={manifest.get('dim')})")
+    return manifest
+
+def check_manifest(manifest: Optional[dict], embeddings: np.ndarray):
+    """
+    Raise ValueError if the embedding matrix doesn't match its manifest, or the
+    manifest doesn't match the extractor this code would use for queries
+    (different dim or preprocessing means online vectors would be incompatible).
+    """
+    if manifest is None:
+        return
+    n, dim = embeddings.shape
+    if manifest.get("dim") != dim:
+        raise ValueError(f"embeddings have {dim} dims but the manifest says {manifest.get('dim')}")
+    if manifest.get("count") is not None and manifest["count"] != n:
+        raise ValueError(f"embeddings have {n} rows but the manifest says {manifest['count']}")
+    model = manifest.get("model")
+    if model not in embedding.EXTRACTORS:
+        raise ValueError(f"embeddings were made with unknown model '{model}'")
+    expected = embedding.get_extractor(model).manifest()
+    for key in ("dim", "preprocessing", "normalization"):
+        if manifest.get(key) != expected[key]:
+            raise ValueError(f"embeddings manifest {key}={manifest.get(key)} does not match the "
+                             f"{model} extractor ({expected[key]}); re-extract the catalog embeddings")
+
 def load_index_map(index_csv: str = EMB_INDEX_FNAME) -> pd.DataFrame:
+    """Embedding row -> id / image_path (a key relative to DATA_DIR in current builds)."""
+    table = _columnar_source(index_csv)
+    if table is not None:
+        idx_df = columnar.read_table(table)
+        logger.info(f"Loaded embeddings index map: {table} ({len(idx_df)} rows, columnar)")
+        return idx_df
     path = _resolve(index_csv)
     _ensure_exists(path)
-    idx_df = pd.read_csv(path, dtype=str, engine="python", on_bad_lines="skip")
+    idx_df = pd.read_csv(path, dtype=str, on_bad_lines="skip")
     idx_df.reset_index(drop=True, inplace=True)
     logger.info(f"Loaded embeddings index map: {path} ({len(idx_df)} rows)")
     return idx_df
 
-def load_nn_index(nn_filename: str = NN_INDEX_FNAME):
-    path = _resolve(nn_filename)
-    if not os.path.exists(path):
-        logger.warning(f"NN index file not found at {path}; returning None")
-        return None
-    nn = joblib.load(path)
-    logger.info(f"Loaded NN index: {path}")
-    return nn
+def load_nn_index(embeddings: Optional[np.ndarray] = None, backend: Optional[str] = None,
+                  nn_filename: str = NN_INDEX_FNAME):
+    """
+    Load the nearest-neighbour index selected by `backend` (default: config.ANN_BACKEND).
+    `embeddings` must be the normalized matrix returned by load_embeddings().
+    Returns an ann_index.VectorIndex, or None if nothing usable is available.
+    If the configured artifact is missing we fall back to exact brute-force
+    search over `embeddings` so the service still starts.
+    """
+    backend = (backend or config.ANN_BACKEND).lower()
+    if backend not in ann_index.BACKENDS:
+        raise ValueError(f"Unknown ANN backend '{backend}'. Choose one of {sorted(ann_index.BACKENDS)}")
+
+    index = None
+    if backend == "sklearn":
+        path = _resolve(nn_filename)
+        if os.path.exists(path):
+            # mmap_mode shares the fitted training matrix between workers
+            index = ann_index.SklearnIndex(joblib.load(path, mmap_mode="r"))
+            logger.info(f"Loaded NN index: {path}")
+        else:
+            logger.warning(f"NN index file not found at {path}")
+    elif backend in ("ivf", "hnsw"):
+        cls = ann_index.BACKENDS[backend]
+        path = _resolve(ANN_INDEX_FNAME.format(backend=backend) + cls.suffix)
+        if os.path.exists(path):
+            if backend == "ivf":
+                if embeddings is None:
+                    raise ValueError("The 'ivf' backend needs the embedding matrix to attach to")
+                index = ann_index.IVFIndex.load(path, nprobe=config.ANN_NPROBE).attach(embeddings, normalized=True)
+            else:
+                index = ann_index.HNSWIndex.load(path, ef_search=config.ANN_EF_SEARCH)
+            logger.info(f"Loaded {backend} index: {path} ({len(index)} vectors, {index.params()})")
+        else:
+            logger.warning(f"{backend} index file not found at {path}")
+
+    if index is None and embeddings is not None:
+        index = ann_index.BruteForceIndex(embeddings, normalized=True)
+        logger.info(f"Using exact brute-force index over {len(index)} vectors")
+    elif index is None:
+        logger.warning("No NN index available; returning None")
+    return index
 
 def load_kmeans(kmeans_filename: str = KMEANS_FNAME):
     path = _resolve(kmeans_filename)
     if not os.path.exists(path):
         logger.warning(f"KMeans model file not found at {path}; returning None")
         return None
-    k = joblib.load(path)
+    k = joblib.load(path, mmap_mode="r")
     logger.info(f"Loaded KMeans model: {path}")
     return k
 
+def load_color_index(color_filename: str = COLOR_INDEX_FNAME) -> Optional[np.ndarray]:
+    """Memory-mapped (N x COLOR_DIM) float16 color descriptors, rows aligned with embeddings."""
+    path = _resolve(color_filename)
+    if not os.path.exists(path):
+        logger.info(f"Color index not found at {path}; color-weighted ranking disabled")
+        return None
+    colors = np.load(path, mmap_mode="r").view(np.ndarray)
+    if colors.ndim != 2 or colors.shape[1] != embedding.COLOR_DIM:
+        raise ValueError(f"color index {path} has shape {colors.shape}, expected (N, {embedding.COLOR_DIM})")
+    logger.info(f"Memory-mapped color index: {path} shape={colors.shape} dtype={colors.dtype}")
+    return colors
+
+def load_neighbor_table(table_dirname: str = NEIGHBORS_DIRNAME,
+                        emb_filename: str = EMBEDDINGS_FNAME) -> Optional[ann_index.NeighborTable]:
+    """
+    Memory-mapped precomputed top-K neighbour table, or None when it is
+    missing, disabled, or was computed from different embeddings.
+    """
+    path = _resolve(table_dirname)
+    if not config.NEIGHBOR_TABLE_ENABLED:
+        return None
+    if not os.path.exists(os.path.join(path, ann_index.NeighborTable.META_FNAME)):
+        logger.info(f"Neighbour table not found at {path}; /similar searches live")
+        return None
+    table = ann_index.NeighborTable.load(path)
+    raw = np.load(_resolve(emb_filename), mmap_mode="r")
+    if table.meta.get("fingerprint") != ann_index.embeddings_fingerprint(raw):
+        logger.warning(f"Neighbour table {path} was built from different embeddings; ignoring it "
+                       f"until build_index_and_clusters.py --neighbors is rerun")
+        return None
+    logger.info(f"Memory-mapped neighbour table: {path} rows={len(table)} k={table.k}")
+    return table
+
+def load_quiz_answers(answers_filename: str = QUIZ_ANSWERS_FNAME) -> List[str]:
+    """
+    Every answer string the quiz can send to /by-quiz (option texts and
+    aesthetics); their TF-IDF vectors are precomputed when the bundle is built.
+    """
+    path = _resolve(answers_filename)
+    if not os.path.exists(path):
+        logger.info(f"Quiz answer vocabulary not found at {path}; every quiz query is vectorized per request")
+        return []
+    with open(path) as f:
+        options = json.load(f).get("options", [])
+    answers = sorted({o[k] for o in options for k in ("text", "aesthetic") if o.get(k)})
+    logger.info(f"Loaded quiz answer vocabulary: {path} ({len(answers)} answers)")
+    return answers
+
 def build_text_matrix(metadata_df: pd.DataFrame):
     """
     Build a TF-IDF matrix from textual metadata fields.
@@ -80,14 +308,150 @@ def build_text_matrix(metadata_df: pd.DataFrame):
     """
     from sklearn.feature_extraction.text import TfidfVectorizer
 
-    # pick text columns (object dtype)
-    text_cols = [c for c in metadata_df.columns if metadata_df[c].dtype == object or metadata_df[c].dtype == "string"]
+    # pick text columns (object dtype, or categorical when read from the columnar table)
+    text_cols = [c for c in metadata_df.columns if metadata_df[c].dtype == object or metadata_df[c].dtype == "string"
+                 or isinstance(metadata_df[c].dtype, pd.CategoricalDtype)]
     if not text_cols:
         # fallback: all columns
         text_cols = list(metadata_df.columns)
 
     combined = metadata_df[text_cols].astype(str).agg(" ".join, axis=1)
-    vectorizer = TfidfVectorizer(max_features=20000, ngram_range=(1, 2))
+    vectorizer = TfidfVectorizer(**TFIDF_PARAMS)
     tfidf = vectorizer.fit_transform(combined)
     logger.info(f"Built TF-IDF matrix: shape={tfidf.shape}")
     return vectorizer, tfidf
+
+def metadata_content_hash(metadata_filename: str = METADATA_FNAME) -> str:
+    """sha256 of the metadata contents (file bytes, or the columnar table's hash) plus the vectorizer settings."""
+    h = hashlib.sha256(json.dumps(TFIDF_PARAMS, sort_keys=True).encode())
+    table = _columnar_source(metadata_filename)
+    if table is not None:
+        h.update(b"columnar:" + columnar.read_schema(table)["content_hash"].encode())
+        return h.hexdigest()
+    path = _resolve(metadata_filename)
+    _ensure_exists(path)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def save_text_matrix(vectorizer, tfidf, content_hash: str, tfidf_filename: str = TFIDF_FNAME):
+    """
+    Persist the fitted vocabulary, idf weights and CSR matrix to one .npz.
+    Terms are stored ordered by column index so the vocabulary dict can be rebuilt
+    without pickling the vectorizer.
+    """
+    path = _resolve(tfidf_filename)
+    tfidf = tfidf.tocsr()
+    terms = np.empty(len(vectorizer.vocabulary_), dtype=object)
+    for term, col in vectorizer.vocabulary_.items():
+        terms[col] = term
+    tmp = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(
+        tmp,
+        data=tfidf.data, indices=tfidf.indices, indptr=tfidf.indptr, shape=np.array(tfidf.shape),
+        idf=vectorizer.idf_, terms=terms.astype(str),
+        content_hash=np.array(content_hash), params=np.array(json.dumps(TFIDF_PARAMS)),
+    )
+    os.replace(tmp, path)
+    logger.info(f"Saved TF-IDF artifact: {path} shape={tfidf.shape} nnz={tfidf.nnz}")
+
+def load_text_matrix(metadata_df: pd.DataFrame, tfidf_filename: str = TFIDF_FNAME,
+                     metadata_filename: str = METADATA_FNAME):
+    """
+    Return (vectorizer, tfidf_matrix) from the precomputed artifact when its
+    content hash matches the current metadata file. Otherwise refit with
+    build_text_matrix() and write a fresh artifact for the next start.
+    """
+    from scipy import sparse
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    path = _resolve(tfidf_filename)
+    content_hash = metadata_content_hash(metadata_filename)
+    if os.path.exists(path):
+        with np.load(path) as z:
+            if str(z["content_hash"]) == content_hash:
+                tfidf = sparse.csr_matrix((z["data"], z["indices"], z["indptr"]), shape=tuple(z["shape"]))
+                vectorizer = TfidfVectorizer(**TFIDF_PARAMS)
+                vectorizer.vocabulary_ = {t: i for i, t in enumerate(z["terms"].tolist())}
+                vectorizer.idf_ = z["idf"]
+                logger.info(f"Loaded TF-IDF artifact: {path} shape={tfidf.shape}")
+                return vectorizer, tfidf
+        logger.info(f"TF-IDF artifact {path} is stale (metadata changed); rebuilding")
+    else:
+        logger.info(f"TF-IDF artifact not found at {path}; building")
+
+    if metadata_df.attrs.get("partial"):
+        # the serving frame skips free-text columns; the vectorizer needs them all
+        metadata_df = load_metadata(metadata_filename)
+    vectorizer, tfidf = build_text_matrix(metadata_df)
+    try:
+        save_text_matrix(vectorizer, tfidf, content_hash, tfidf_filename)
+    except OSError as e:
+        logger.warning(f"Could not save TF-IDF artifact {path}: {e}")
+    return vectorizer, tfidf
+
+def load_resources() -> dict:
+    """
+    Load every serving artifact; the result is what recommender.init() expects.
+    Per-artifact load times are recorded in LOAD_TIMINGS.
+    """
+    with timed("metadata"):
+        metadata_df = load_metadata(skip_text=True)
+    with timed("embeddings"):
+        embeddings = load_embeddings()
+        manifest = load_manifest()
+        manifest_error = None
+        try:
+            check_manifest(manifest, embeddings)
+        except ValueError as e:
+            # the catalog still serves /similar and /by-quiz; only online
+            # image queries would produce vectors in the wrong space
+            manifest_error = str(e)
+            logger.error(f"Embeddings manifest mismatch, image queries are disabled: {e}")
+    with timed("index_map"):
+        index_df = load_index_map()
+    with timed("nn_index"):
+        nn = load_nn_index(embeddings=embeddings)
+    with timed("kmeans"):
+        kmeans = load_kmeans()
+    with timed("colors"):
+        colors = load_color_index()
+    with timed("neighbors"):
+        neighbors = load_neighbor_table()
+    with timed("tfidf"):
+        vectorizer, tfidf = load_text_matrix(metadata_df)
+        quiz_answers = load_quiz_answers()
+    return {
+        "embeddings": embeddings,
+        "index_df": index_df,
+        "nn": nn,
+        "kmeans": kmeans,
+        "vectorizer": vectorizer,
+        "tfidf": tfidf,
+        "metadata_df": metadata_df,
+        "manifest": manifest,
+        "manifest_error": manifest_error,
+        "colors": colors,
+        "quiz_answers": quiz_answers,
+        "neighbors": neighbors,
+    }
+
+def artifact_signature() -> tuple:
+    """
+    (name, mtime_ns, size) of every source artifact that exists, used to detect
+    a new build on disk. Files the service derives itself (normalized embeddings
+    cache, TF-IDF artifact) are left out so writing them never triggers a reload.
+    """
+    names = [METADATA_FNAME, EMBEDDINGS_FNAME, EMB_MANIFEST_FNAME, EMB_INDEX_FNAME, NN_INDEX_FNAME, KMEANS_FNAME,
+             COLOR_INDEX_FNAME, QUIZ_ANSWERS_FNAME]
+    names += [os.path.join(table_name(f), columnar.SCHEMA_FNAME) for f in (METADATA_FNAME, EMB_INDEX_FNAME)]
+    names += [ANN_INDEX_FNAME.format(backend=b) + cls.suffix for b, cls in ann_index.BACKENDS.items() if cls.suffix]
+    names.append(os.path.join(NEIGHBORS_DIRNAME, ann_index.NeighborTable.META_FNAME))
+    sig = []
+    for name in names:
+        path = _resolve(name)
+        if os.path.exists(path):
+            st = os.stat(path)
+            sig.append((name, st.st_mtime_ns, st.st_size))
+    return tuple(sig)
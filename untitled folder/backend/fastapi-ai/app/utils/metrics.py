@@ -0,0 +1,180 @@
+# backend/fastapi-ai/app/utils/metrics.py
+"""
+In-process latency metrics, rendered in the Prometheus text format at GET /metrics.
+
+Cheap enough to leave on in production:
+  - histograms have fixed buckets; an observation is one bisect over ~15
+    floats and two increments under an uncontended lock, no allocation once
+    a label combination has been seen,
+  - gauges are callbacks evaluated only when /metrics is scraped, so cache,
+    queue and bundle state cost nothing on the request path.
+
+Request code times its stages with StageTimer:
+
+    t = metrics.StageTimer("by_quiz")
+    matched = text_index.scores(...)
+    t.lap("text_scores")
+    ...
+
+which records each lap in reco_stage_seconds{op="by_quiz",stage="text_scores"}.
+Stage names are part of the dashboards' contract; by_quiz reports
+text_scores, filter_mask, text_topk, visual_rerank and rows whichever text
+path (precomputed answers or vectorizer) served the request.
+METRICS_ENABLED=false turns every observation into a no-op.
+"""
+import bisect
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Tuple, Union
+
+from .. import config
+
+ENABLED = config.METRICS_ENABLED
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds; sub-millisecond stages (TF-IDF transform, masking) up to deadline-bound requests
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Histogram:
+    """Fixed-bucket histogram with optional labels (positional label values in observe())."""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # labels -> [count per bucket..., +Inf, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        if not ENABLED:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                le = _labels(self.labelnames, labels, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lbl = _labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{lbl} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{lbl} {cumulative}")
+        return lines
+
+
+class CallbackMetric:
+    """
+    Gauge or counter whose value is read at scrape time. fn returns a number,
+    or a {label value: number} dict for a metric with one label.
+    """
+
+    def __init__(self, name: str, help: str, fn: Callable[[], Union[float, Dict[str, float]]],
+                 kind: str = "gauge", labelname: str = ""):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.kind = kind
+        self.labelname = labelname
+
+    def collect(self) -> List[str]:
+        value = self.fn()
+        if value is None:
+            return []
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if isinstance(value, dict):
+            for label, v in sorted(value.items()):
+                lines.append(f"{self.name}{_labels((self.labelname,), (label,))} {_number(v)}")
+        else:
+            lines.append(f"{self.name} {_number(value)}")
+        return lines
+
+
+_registry: Dict[str, Union[Histogram, CallbackMetric]] = {}
+_registry_lock = threading.Lock()
+
+
+def _register(metric):
+    with _registry_lock:
+        _registry[metric.name] = metric
+    return metric
+
+
+def histogram(name: str, help: str, labelnames: Tuple[str, ...] = (),
+              buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help, labelnames, buckets))
+
+
+def gauge(name: str, help: str, fn: Callable, labelname: str = "") -> CallbackMetric:
+    return _register(CallbackMetric(name, help, fn, "gauge", labelname))
+
+
+def counter(name: str, help: str, fn: Callable, labelname: str = "") -> CallbackMetric:
+    """A monotonically increasing value kept elsewhere (e.g. cache hits); name should end in _total."""
+    return _register(CallbackMetric(name, help, fn, "counter", labelname))
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines: List[str] = []
+    for m in metrics:
+        lines.extend(m.collect())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = histogram("reco_stage_seconds", "Time spent in one stage of a recommender operation",
+                          ("op", "stage"))
+REQUEST_SECONDS = histogram("reco_request_seconds", "End-to-end handler latency by endpoint",
+                            ("endpoint",))
+
+
+class StageTimer:
+    """Records consecutive stages of one operation into reco_stage_seconds."""
+
+    __slots__ = ("op", "_start", "_last")
+
+    def __init__(self, op: str):
+        self.op = op
+        self._start = self._last = time.perf_counter()
+
+    def lap(self, stage: str):
+        """Record the time since the previous lap (or construction) as `stage`."""
+        now = time.perf_counter()
+        STAGE_SECONDS.observe(now - self._last, self.op, stage)
+        self._last = now
+
+    def total(self) -> float:
+        return time.perf_counter() - self._start
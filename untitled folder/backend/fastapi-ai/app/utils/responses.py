@@ -0,0 +1,39 @@
+# backend/fastapi-ai/app/utils/responses.py
+"""
+Fast JSON responses for pre-shaped payloads.
+
+Routes that already hold plain dicts/lists return FastJSONResponse directly,
+which skips FastAPI's response_model validation and jsonable_encoder pass.
+orjson is used when installed (several times faster than the stdlib encoder,
+and it serializes NumPy scalars natively); otherwise json.dumps is used.
+"""
+import json
+from typing import Any
+
+import numpy as np
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+def _default(obj: Any):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY, default=_default)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    # a JSONResponse subclass so OpenAPI documents routes using it as JSON
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+bench_recommender.py
+- Builds synthetic artifacts shaped like production in a work dir (default
+  44k x 2048 float32 embeddings, index map with KMeans clusters, metadata with
+  the real column names for TF-IDF and filters, columnar tables, kmeans model,
+  quiz answer vocabulary, and with --neighbors K a top-K neighbour table)
+- Times every loader.load_* function, loader.build_text_matrix,
+  recommender.recommend_similar and recommender.recommend_by_quiz
+- Reports p50/p95/p99/mean latency, throughput and peak RSS per benchmark
+  and writes them to a JSON file (default benchmarks/results/, not tracked)
+- --compare BASE.json NEW.json prints the change between two runs
+
+Artifacts are generated from a fixed seed and reused when the work dir already
+holds them for the same --items/--dim, so runs on one machine are comparable.
+Settings from app/config.py (ANN_BACKEND, EMBEDDINGS_DTYPE, ...) are read from
+the environment as usual and recorded in the report.
+
+Usage (from backend/fastapi-ai):
+    python3 benchmarks/bench_recommender.py --out benchmarks/results/base.json
+    ANN_BACKEND=ivf python3 benchmarks/bench_recommender.py --out benchmarks/results/ivf.json
+    python3 benchmarks/bench_recommender.py --compare benchmarks/results/base.json benchmarks/results/ivf.json
+    python3 benchmarks/bench_recommender.py --items 5000 --dim 256 --queries 100   # quick run
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+from app import config  # noqa: E402
+from app.services import ann_index, recommender  # noqa: E402
+from app.utils import columnar, loader  # noqa: E402
+
+GENDERS = ["Men", "Women", "Unisex", "Boys", "Girls"]
+MASTER = ["Apparel", "Accessories", "Footwear", "Personal Care"]
+ARTICLES = ["Tshirts", "Shirts", "Jeans", "Casual Shoes", "Sports Shoes", "Watches", "Handbags", "Kurtas",
+            "Tops", "Trousers", "Sandals", "Belts", "Socks", "Dresses", "Jackets", "Sweatshirts"]
+COLOURS = ["Black", "White", "Blue", "Navy Blue", "Red", "Grey", "Green", "Brown", "Pink", "Purple",
+           "Yellow", "Beige", "Maroon", "Olive", "Orange", "Silver"]
+SEASONS = ["Summer", "Winter", "Fall", "Spring"]
+USAGES = ["Casual", "Formal", "Sports", "Ethnic", "Party", "Travel"]
+BRANDS = [f"Brand{i}" for i in range(300)]
+QUIZ_WORDS = ARTICLES + COLOURS + SEASONS + USAGES + ["slim fit", "cotton", "printed", "striped", "leather"]
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def build_artifacts(workdir: Path, n: int, dim: int, clusters: int, neighbors: int = 0, seed: int = 0):
+    """Write the synthetic artifacts the loader expects into workdir."""
+    stamp = workdir / "bench_artifacts.json"
+    spec = {"items": n, "dim": dim, "clusters": clusters, "seed": seed, "quiz_answers": len(QUIZ_WORDS),
+            "neighbors": neighbors}
+    if stamp.exists() and json.loads(stamp.read_text()) == spec:
+        print(f"Reusing artifacts in {workdir}")
+        return
+    from sklearn.cluster import MiniBatchKMeans
+
+    workdir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+
+    # clustered embeddings: items scattered around `clusters` centres, like CNN features
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    embs = centres[labels] + 0.6 * rng.standard_normal((n, dim), dtype=np.float32)
+    np.save(workdir / loader.EMBEDDINGS_FNAME, embs)
+
+    ids = np.arange(10000, 10000 + n).astype(str)
+    idx_df = pd.DataFrame({"id": ids, "image_path": [f"images/{i}.jpg" for i in ids]})
+    idx_df.to_csv(workdir / loader.EMB_INDEX_FNAME, index=False)
+    columnar.write_table(idx_df, str(workdir / loader.table_name(loader.EMB_INDEX_FNAME)),
+                         string_columns=("id", "image_path"))
+
+    pick = lambda values: rng.choice(values, n)  # noqa: E731
+    meta = pd.DataFrame({
+        "id": ids, "gender": pick(GENDERS), "masterCategory": pick(MASTER), "subCategory": pick(MASTER),
+        "articleType": pick(ARTICLES), "baseColour": pick(COLOURS), "season": pick(SEASONS),
+        "year": pick(["2011.0", "2012.0", "2015.0", "2017.0"]), "usage": pick(USAGES),
+    })
+    meta["productDisplayName"] = (pick(BRANDS) + " " + meta["gender"] + " " + meta["baseColour"] + " "
+                                  + pick(["Printed", "Solid", "Striped", "Slim Fit", "Cotton"]) + " "
+                                  + meta["articleType"])
+    meta["image_path"] = idx_df["image_path"]
+    meta.sample(frac=1.0, random_state=seed).to_csv(workdir / loader.METADATA_FNAME, index=False)
+    columnar.write_table(pd.read_csv(workdir / loader.METADATA_FNAME, dtype=str).fillna(""),
+                         str(workdir / loader.table_name(loader.METADATA_FNAME)))
+
+    sample = embs[rng.choice(n, min(n, 10000), replace=False)]
+    kmeans = MiniBatchKMeans(n_clusters=clusters, random_state=seed, n_init=1, batch_size=2048).fit(sample)
+    kmeans.labels_ = kmeans.predict(embs)
+    joblib.dump(kmeans, workdir / loader.KMEANS_FNAME)
+    idx_df.assign(cluster=kmeans.labels_).to_csv(workdir / "embeddings_index_with_clusters.csv", index=False)
+
+    # the quiz's answer vocabulary, as written by data/scripts/export_quiz_answers.py
+    options = [{"gender": "", "question": i, "value": "A", "text": w, "aesthetic": ""}
+               for i, w in enumerate(QUIZ_WORDS)]
+    (workdir / loader.QUIZ_ANSWERS_FNAME).write_text(json.dumps({"source": "bench", "options": options}))
+
+    shutil.rmtree(workdir / loader.NEIGHBORS_DIRNAME, ignore_errors=True)
+    if neighbors > 0:
+        ann_index.NeighborTable.build(embs, neighbors, workers=os.cpu_count() or 1).save(
+            str(workdir / loader.NEIGHBORS_DIRNAME))
+
+    # derived files from a previous spec must not be reused
+    for name in os.listdir(workdir):
+        if name.startswith("embeddings.norm.") or name in (loader.TFIDF_FNAME,):
+            os.remove(workdir / name)
+    stamp.write_text(json.dumps(spec))
+    print(f"Built artifacts for {n}x{dim} in {workdir} ({time.perf_counter() - start:.1f}s)")
+
+
+def measure(name: str, fn, repeat: int, warmup: int = 1, args_for=None) -> dict:
+    """Run fn `warmup` + `repeat` times; args_for(i) supplies per-call kwargs."""
+    call = (lambda i: fn(**args_for(i))) if args_for else (lambda i: fn())
+    for i in range(warmup):
+        call(i)
+    lat = np.empty(repeat)
+    total_start = time.perf_counter()
+    for i in range(repeat):
+        start = time.perf_counter()
+        call(i)
+        lat[i] = time.perf_counter() - start
+    total = time.perf_counter() - total_start
+    ms = lat * 1000
+    row = {
+        "calls": repeat,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "throughput_per_s": repeat / total if total > 0 else float("inf"),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    print(f"{name:<28} p50={row['p50_ms']:9.3f}ms p95={row['p95_ms']:9.3f}ms p99={row['p99_ms']:9.3f}ms "
+          f"{row['throughput_per_s']:10.1f}/s rss={row['peak_rss_mb']:.0f}MB")
+    return row
+
+
+def run(args) -> dict:
+    workdir = Path(args.workdir)
+    # built in a child process so its memory does not count towards our peak RSS
+    builder = multiprocessing.Process(target=build_artifacts,
+                                      args=(workdir, args.items, args.dim, args.clusters, args.neighbors))
+    builder.start()
+    builder.join()
+    if builder.exitcode != 0:
+        raise SystemExit(f"building synthetic artifacts failed (exit code {builder.exitcode})")
+    loader.DATA_DIR = str(workdir)
+    rng = np.random.default_rng(1)
+    results = {}
+
+    loads = {
+        "load_metadata": lambda: loader.load_metadata(),
+        "load_metadata_serving": lambda: loader.load_metadata(skip_text=True),
+        "load_embeddings": lambda: loader.load_embeddings(),
+        "load_embeddings_in_memory": lambda: loader.load_embeddings(mmap=False),
+        "load_index_map": lambda: loader.load_index_map(),
+        "load_manifest": lambda: loader.load_manifest(),
+        "load_kmeans": lambda: loader.load_kmeans(),
+        "load_color_index": lambda: loader.load_color_index(),
+        "load_neighbor_table": lambda: loader.load_neighbor_table(),
+        "load_quiz_answers": lambda: loader.load_quiz_answers(),
+    }
+    for name, fn in loads.items():
+        results[name] = measure(name, fn, args.load_repeat)
+
+    metadata_df = loader.load_metadata()
+    embeddings = loader.load_embeddings()
+    results["load_nn_index"] = measure("load_nn_index", lambda: loader.load_nn_index(embeddings=embeddings),
+                                       args.load_repeat)
+    results["build_text_matrix"] = measure("build_text_matrix", lambda: loader.build_text_matrix(metadata_df),
+                                           args.load_repeat, warmup=0)
+    results["load_text_matrix"] = measure("load_text_matrix", lambda: loader.load_text_matrix(metadata_df),
+                                          args.load_repeat)
+    results["load_resources"] = measure("load_resources", loader.load_resources, args.load_repeat, warmup=0)
+
+    recommender.init(loader.load_resources())
+    ids = recommender.BUNDLE.ids
+    pids = [str(ids[i]) for i in rng.integers(0, len(ids), args.queries)]
+    quizzes = [list(rng.choice(QUIZ_WORDS, rng.integers(2, 5), replace=False)) for _ in range(args.queries)]
+    # the same words as one free-text answer, which is not in the quiz vocabulary
+    free_text = [[" ".join(q)] for q in quizzes]
+    genders = rng.choice(["male", "female", ""], args.queries)
+
+    results["recommend_similar"] = measure(
+        "recommend_similar", recommender.recommend_similar, args.queries,
+        args_for=lambda i: {"product_id": pids[i], "top_k": args.top_k})
+    results["recommend_similar_batch"] = measure(
+        "recommend_similar_batch(32)", recommender.recommend_similar_batch, max(1, args.queries // 32),
+        args_for=lambda i: {"product_ids": pids[(i * 32) % len(pids):][:32], "top_k": args.top_k})
+    results["recommend_by_quiz"] = measure(
+        "recommend_by_quiz", recommender.recommend_by_quiz, args.queries,
+        args_for=lambda i: {"answers": quizzes[i], "gender": genders[i], "top_k": args.top_k})
+    results["recommend_by_quiz_filtered"] = measure(
+        "recommend_by_quiz(filters)", recommender.recommend_by_quiz, args.queries,
+        args_for=lambda i: {"answers": quizzes[i], "gender": genders[i], "top_k": args.top_k,
+                            "filters": {"season": [SEASONS[i % 4]], "usage": ["Casual"]}})
+    results["recommend_by_quiz_free_text"] = measure(
+        "recommend_by_quiz(free text)", recommender.recommend_by_quiz, args.queries,
+        args_for=lambda i: {"answers": free_text[i], "gender": genders[i], "top_k": args.top_k})
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def report_meta(args) -> dict:
+    settings = {k: getattr(config, k) for k in dir(config) if k.isupper()}
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "items": args.items,
+        "dim": args.dim,
+        "queries": args.queries,
+        "top_k": args.top_k,
+        "config": {k: v for k, v in settings.items() if isinstance(v, (int, float, str, bool))},
+    }
+
+
+def compare(base_path: str, new_path: str):
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    for key in ("items", "dim", "queries", "cpu_count"):
+        if base["meta"].get(key) != new["meta"].get(key):
+            print(f"warning: {key} differs ({base['meta'].get(key)} vs {new['meta'].get(key)})")
+    metrics = ("p50_ms", "p95_ms", "p99_ms", "throughput_per_s", "peak_rss_mb")
+    print(f"{'benchmark':<28}" + "".join(f"{m:>26}" for m in metrics))
+    for name in base["results"]:
+        if name not in new["results"]:
+            continue
+        cells = []
+        for m in metrics:
+            a, b = base["results"][name][m], new["results"][name][m]
+            change = (b - a) / a * 100 if a else 0.0
+            cells.append(f"{a:9.2f} -> {b:9.2f} {change:+5.0f}%")
+        print(f"{name:<28}" + "".join(f"{c:>26}" for c in cells))
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Micro-benchmarks for the recommender hot paths")
+    p.add_argument("--items", type=int, default=44000, help="catalog size")
+    p.add_argument("--dim", type=int, default=2048, help="embedding dimension")
+    p.add_argument("--clusters", type=int, default=20, help="KMeans clusters in the synthetic catalog")
+    p.add_argument("--neighbors", type=int, default=0,
+                   help="also build a top-K neighbour table (slow: an all-pairs GEMM); 0 skips it")
+    p.add_argument("--queries", type=int, default=500, help="calls per recommender benchmark")
+    p.add_argument("--load-repeat", type=int, default=5, help="calls per loader benchmark")
+    p.add_argument("--top-k", type=int, default=10)
+    p.add_argument("--workdir", default=str(ROOT / "benchmarks" / "artifacts"),
+                   help="where synthetic artifacts are built and cached")
+    p.add_argument("--out", default=str(ROOT / "benchmarks" / "results" / "bench_results.json"))
+    p.add_argument("--verbose", action="store_true", help="keep the service's INFO/WARNING logs")
+    p.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two result files and exit")
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+    if not args.verbose:
+        # loader logs every artifact it opens, which would drown the table
+        logging.disable(logging.WARNING)
+    results = run(args)
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump({"meta": report_meta(args), "results": results}, f, indent=2)
+    print("Saved:", args.out)
@@ -0,0 +1,30 @@
+# backend/fastapi-ai/tests/test_batcher.py
+"""MicroBatcher key grouping (run from backend/fastapi-ai: python -m pytest tests)."""
+import asyncio
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.utils.batcher import MicroBatcher  # noqa: E402
+
+
+def test_items_with_different_keys_are_never_stacked_together():
+    calls = []
+
+    def fn(batch, key):
+        calls.append((key, len(batch)))
+        return batch * (10 if key == "a" else 100)
+
+    batcher = MicroBatcher(fn, max_batch_size=8, max_wait_ms=50, name="test-batcher")
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit(np.array([float(i)]), key="a" if i % 2 else "b")
+                                      for i in range(6)))
+    try:
+        out = asyncio.run(run())
+    finally:
+        batcher.shutdown()
+    assert [float(o[0]) for o in out] == [0.0, 10.0, 200.0, 30.0, 400.0, 50.0]
+    assert sorted(calls) == [("a", 3), ("b", 3)]
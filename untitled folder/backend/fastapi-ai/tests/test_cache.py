@@ -0,0 +1,76 @@
+# backend/fastapi-ai/tests/test_cache.py
+"""Result cache: byte budget, TTL, oversized entries and bundle-swap invalidation (run from backend/fastapi-ai)."""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.services import ann_index, recommender  # noqa: E402
+from app.utils import cache as cache_mod  # noqa: E402
+from app.utils.cache import TTLCache, approx_size  # noqa: E402
+
+
+def _entry(i):
+    return ("k", i), [{"id": str(i), "score": 0.5}]
+
+
+ENTRY_BYTES = approx_size(_entry(0)[0]) + approx_size(_entry(0)[1])
+
+
+def test_byte_budget_evicts_least_recently_used():
+    c = TTLCache(max_bytes=3 * ENTRY_BYTES, ttl_s=60)
+    for i in range(3):
+        c.set(*_entry(i))
+    assert c.get(("k", 0)) is not None    # 0 is now the most recently used
+    c.set(*_entry(3))
+    assert c.get(("k", 1)) is None and c.evictions == 1
+    assert all(c.get(("k", i)) is not None for i in (0, 2, 3))
+    assert c.bytes == 3 * ENTRY_BYTES <= c.max_bytes
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_mod.time, "monotonic", lambda: now[0])
+    c = TTLCache(max_bytes=10 * ENTRY_BYTES, ttl_s=5)
+    c.set(*_entry(0))
+    now[0] += 4.9
+    assert c.get(("k", 0)) is not None
+    now[0] += 0.2
+    assert c.get(("k", 0)) is None
+    assert len(c) == 0 and c.bytes == 0
+
+
+def test_oversized_entry_is_rejected_without_evicting():
+    c = TTLCache(max_bytes=2 * ENTRY_BYTES, ttl_s=60)
+    c.set(*_entry(0))
+    c.set(("big",), ["x" * (2 * ENTRY_BYTES)])
+    assert c.get(("big",)) is None
+    assert c.get(("k", 0)) is not None and c.evictions == 0
+
+
+def test_disabled_cache_stores_nothing():
+    c = TTLCache(max_bytes=0, ttl_s=60)
+    c.set(*_entry(0))
+    assert len(c) == 0
+
+
+def test_swap_clears_results_and_bumps_key_version():
+    previous = recommender.BUNDLE
+    embs = ann_index.l2_normalize(np.random.default_rng(0).standard_normal((20, 4)))
+    ids = [str(i) for i in range(20)]
+    resources = {"embeddings": embs, "index_df": pd.DataFrame({"id": ids, "image_path": ids})}
+    try:
+        recommender.init(resources)
+        old_key = recommender.similar_cache_key("3", 5)
+        recommender.RESULT_CACHE.set(old_key, [{"id": "4"}])
+        assert recommender.RESULT_CACHE.get(old_key) is not None
+        recommender.init(resources)
+        new_key = recommender.similar_cache_key("3", 5)
+        assert new_key != old_key
+        assert len(recommender.RESULT_CACHE) == 0
+        assert recommender.RESULT_CACHE.get(old_key) is None
+    finally:
+        recommender.BUNDLE = previous
+        recommender.RESULT_CACHE.clear()
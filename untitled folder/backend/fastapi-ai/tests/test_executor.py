@@ -0,0 +1,78 @@
+# backend/fastapi-ai/tests/test_executor.py
+"""RecommenderPool load shedding and deadlines (run from backend/fastapi-ai: python -m pytest tests)."""
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.utils.executor import DeadlineExceeded, Overloaded, RecommenderPool  # noqa: E402
+
+
+@pytest.fixture
+def pool():
+    p = RecommenderPool(max_workers=1, max_queue=1)
+    yield p
+    p.shutdown()
+
+
+def wait_for_idle(pool, timeout=2.0):
+    # slots are released by a done-callback on the worker thread
+    until = time.monotonic() + timeout
+    while pool.pending and time.monotonic() < until:
+        time.sleep(0.005)
+    return pool.pending == 0
+
+
+def test_saturated_pool_rejects_and_releases(pool):
+    gate = threading.Event()
+
+    async def run():
+        running = asyncio.ensure_future(pool.run(gate.wait, 5))
+        queued = asyncio.ensure_future(pool.run(lambda: "queued"))
+        await asyncio.sleep(0.05)
+        assert pool.pending == 2
+        with pytest.raises(Overloaded):
+            await pool.run(lambda: "rejected")
+        gate.set()
+        return await running, await queued
+
+    assert asyncio.run(run()) == (True, "queued")
+    assert pool.rejected == 1
+    assert wait_for_idle(pool)
+    assert asyncio.run(pool.run(lambda: "after")) == "after"
+
+
+def test_deadline_exceeded_releases_slot_when_work_ends(pool):
+    gate = threading.Event()
+
+    async def run():
+        with pytest.raises(DeadlineExceeded):
+            await pool.run(gate.wait, 5, deadline_s=0.05)
+
+    asyncio.run(run())
+    assert pool.timed_out == 1
+    # the thread is still busy: the slot stays taken until the work returns
+    assert pool.pending == 1
+    gate.set()
+    assert wait_for_idle(pool)
+
+
+def test_expired_queued_task_is_skipped(pool):
+    gate = threading.Event()
+    calls = []
+
+    async def run():
+        running = asyncio.ensure_future(pool.run(gate.wait, 5))
+        await asyncio.sleep(0.01)
+        with pytest.raises(DeadlineExceeded):
+            await pool.run(calls.append, "late", deadline_s=0.05)
+        gate.set()
+        await running
+
+    asyncio.run(run())
+    assert wait_for_idle(pool)
+    assert calls == []
@@ -0,0 +1,71 @@
+# backend/fastapi-ai/tests/test_neighbor_table.py
+"""/similar served from the precomputed neighbour table vs live search (run from backend/fastapi-ai)."""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.services import ann_index, recommender  # noqa: E402
+
+N, DIM, K = 300, 16, 10
+
+
+def _resources(with_table: bool):
+    rng = np.random.default_rng(0)
+    embs = ann_index.l2_normalize(rng.standard_normal((N, DIM)))
+    ids = [str(20000 + i) for i in range(N)]
+    return {
+        "embeddings": embs,
+        "index_df": pd.DataFrame({"id": ids, "image_path": [f"images/{i}.jpg" for i in ids]}),
+        "neighbors": ann_index.NeighborTable.build(embs, K) if with_table else None,
+    }
+
+
+@pytest.fixture
+def use_bundle():
+    previous = recommender.BUNDLE
+
+    def use(with_table: bool):
+        recommender.init(_resources(with_table))
+        return recommender.BUNDLE
+    yield use
+    recommender.BUNDLE = previous
+
+
+def _ids(rows):
+    return [r["id"] for r in rows]
+
+
+def test_table_matches_live_search(use_bundle):
+    pids = [str(20000 + i) for i in range(0, N, 7)]
+    use_bundle(with_table=False)
+    live = {pid: _ids(recommender.recommend_similar(pid, top_k=K)) for pid in pids}
+    live_batch = recommender.recommend_similar_batch(pids, top_k=K)
+    use_bundle(with_table=True)
+    for pid in pids:
+        assert _ids(recommender.recommend_similar(pid, top_k=K)) == live[pid]
+    table_batch = recommender.recommend_similar_batch(pids, top_k=K)
+    assert {p: _ids(r) for p, r in table_batch.items()} == {p: _ids(r) for p, r in live_batch.items()}
+
+
+def test_top_k_beyond_table_and_unknown_ids_search_live(use_bundle, monkeypatch):
+    b = use_bundle(with_table=True)
+    live_calls = []
+    search = recommender._search
+    monkeypatch.setattr(recommender, "_search", lambda *a, **kw: live_calls.append(1) or search(*a, **kw))
+    pid = "20003"
+
+    recommender.recommend_similar(pid, top_k=K)
+    assert live_calls == []
+
+    wide = recommender.recommend_similar(pid, top_k=K + 5)
+    assert live_calls and len(wide) == K + 5
+    exact = np.argsort(-(b.embs @ b.embs[b.id_to_pos[pid]]))
+    assert _ids(wide) == [b.ids[i] for i in exact if b.ids[i] != pid][:K + 5]
+
+    assert recommender.recommend_similar("nope", top_k=K) == []
+    out = recommender.recommend_similar_batch([pid, "nope"], top_k=K, top_k_by_id={pid: K + 5})
+    assert out["nope"] == [] and _ids(out[pid]) == _ids(wide)
@@ -0,0 +1,91 @@
+# backend/fastapi-ai/tests/test_quiz_text.py
+"""Quiz text retrieval on a tiny in-memory catalog (run from backend/fastapi-ai: python -m pytest tests)."""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.services import ann_index, recommender  # noqa: E402
+from app.utils import loader  # noqa: E402
+
+KNOWN_ANSWERS = ["Black Shirts", "Casual", "Red Dresses"]
+
+
+@pytest.fixture(scope="module")
+def bundle():
+    rng = np.random.default_rng(0)
+    n = 30
+    ids = [str(10000 + i) for i in range(n)]
+    meta = pd.DataFrame({
+        "id": ids,
+        "gender": rng.choice(["Men", "Women"], n),
+        "articleType": rng.choice(["Shirts", "Dresses", "Jeans"], n),
+        "baseColour": rng.choice(["Black", "Red", "Blue"], n),
+        "usage": rng.choice(["Casual", "Formal"], n),
+    })
+    meta["productDisplayName"] = meta["baseColour"] + " " + meta["articleType"]
+    vectorizer, tfidf = loader.build_text_matrix(meta)
+    resources = {
+        "embeddings": ann_index.l2_normalize(rng.standard_normal((n, 8))),
+        "index_df": pd.DataFrame({"id": ids, "image_path": [f"images/{i}.jpg" for i in ids]}),
+        "metadata_df": meta,
+        "vectorizer": vectorizer,
+        "tfidf": tfidf,
+        "quiz_answers": KNOWN_ANSWERS,
+    }
+    previous = recommender.BUNDLE
+    recommender.init(resources)
+    yield recommender.BUNDLE
+    recommender.BUNDLE = previous
+
+
+def test_answer_vectors_empty_query(bundle):
+    rows, scores = bundle.answer_vectors.scores([])
+    assert len(rows) == 0 and len(scores) == 0
+
+
+@pytest.mark.parametrize("answers", [[], ["  ", ""]])
+def test_by_quiz_without_answers_returns_results(bundle, answers):
+    out = recommender.recommend_by_quiz(answers, top_k=3)
+    assert len(out["results"]) == 3
+
+
+def test_known_answers_match_vectorizer(bundle):
+    answers = recommender.normalize_answers(KNOWN_ANSWERS)
+    rows, scores = bundle.answer_vectors.scores(answers)
+    q_vec = bundle.vectorizer.transform([" ".join(answers)])
+    exp_rows, exp_scores = bundle.text_index.scores(q_vec.indices, q_vec.data)
+    assert np.array_equal(rows, exp_rows)
+    assert np.allclose(scores, exp_scores)
+
+
+def test_by_quiz_stage_names_are_stable(bundle, monkeypatch):
+    from app.utils import metrics
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    expected = {"text_scores", "filter_mask", "text_topk", "visual_rerank", "rows"}
+    for answers in (KNOWN_ANSWERS, ["something not in the quiz"]):
+        metrics.STAGE_SECONDS._series.clear()
+        recommender.recommend_by_quiz(answers, top_k=3)
+        assert {stage for op, stage in metrics.STAGE_SECONDS._series if op == "by_quiz"} == expected
+
+
+def test_unmatched_filters_keep_gender(bundle):
+    out = recommender.recommend_by_quiz(KNOWN_ANSWERS, gender="Female", top_k=5,
+                                        filters={"articleType": ["Sarees"]})
+    assert out["filters_relaxed"] is True
+    assert out["results"] and all(r["attributes"]["gender"] == "Women" for r in out["results"])
+
+
+def test_unmatched_gender_falls_back_to_unfiltered(bundle):
+    out = recommender.recommend_by_quiz(KNOWN_ANSWERS, gender="Nonbinary", top_k=5)
+    assert len(out["results"]) == 5 and out["filters_relaxed"] is True
+
+
+def test_gender_values_include_kids_and_unisex():
+    from app.services.data_loader import gender_values
+    assert set(gender_values("Male")) == {"men", "boys", "unisex"}
+    assert set(gender_values("female")) == {"women", "girls", "unisex"}
+    assert gender_values("Other") == ()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+build_color_index.py
+- Loads embeddings_index.csv and computes a compact HSV color descriptor
+  (app/services/embedding.color_descriptor, 72 floats) for every catalog image,
+  spread over a pool of worker processes (--workers)
+- Rows are aligned with embeddings.npy; images that cannot be read get an
+  all-zero row (color similarity 0 to everything)
+- Saves the matrix as float16 so the API can memory-map it and blend color
+  similarity into /similar without decoding any image per request
+Outputs:
+- data/processed/color_index.npy
+
+Usage (from project root):
+    python3 data/scripts/build_color_index.py --workers 8
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from tqdm import tqdm
+
+ROOT = Path(__file__).resolve().parent.parent
+PROCESSED = ROOT / "processed"
+IDX_CSV = PROCESSED / "embeddings_index.csv"
+IMAGES_DIR = PROCESSED / "images"
+COLOR_PATH = PROCESSED / "color_index.npy"
+
+# the descriptor lives in the API package so build and serve share one implementation
+sys.path.insert(0, str(ROOT.parent / "backend" / "fastapi-ai"))
+from app.services import embedding  # noqa: E402
+
+
+def resolve_image(path: str) -> Path:
+    # image_path is a key relative to data/processed; older builds stored
+    # absolute paths from another machine, so fall back to images/<name>
+    p = Path(path)
+    if not p.is_absolute():
+        p = PROCESSED / p
+    return p if p.exists() else IMAGES_DIR / p.name
+
+
+def describe(path: str) -> np.ndarray:
+    try:
+        return embedding.color_descriptor(resolve_image(path))
+    except (ValueError, OSError):
+        return np.zeros(embedding.COLOR_DIM, dtype=np.float32)
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Precompute color descriptors for the catalog")
+    p.add_argument("--workers", type=int, default=os.cpu_count(), help="processes decoding images")
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    idx = pd.read_csv(IDX_CSV, dtype=str)
+    paths = idx["image_path"].fillna("").tolist()
+    colors = np.zeros((len(paths), embedding.COLOR_DIM), dtype=np.float16)
+    with ProcessPoolExecutor(max_workers=args.workers) as ex:
+        for i, desc in enumerate(tqdm(ex.map(describe, paths, chunksize=64), total=len(paths), unit="img")):
+            colors[i] = desc
+    missing = int((~colors.any(axis=1)).sum())
+    tmp = COLOR_PATH.with_name("tmp_" + COLOR_PATH.name)
+    np.save(tmp, colors)
+    os.replace(tmp, COLOR_PATH)
+    print(f"Saved: {COLOR_PATH} shape {colors.shape} ({missing} unreadable images)")
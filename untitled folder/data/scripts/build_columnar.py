@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+build_columnar.py
+- Converts metadata_clean.csv and embeddings_index.csv into the columnar
+  tables the API memory-maps at startup (see app/utils/columnar.py):
+  low-cardinality columns become integer codes + category dictionaries,
+  the rest fixed-width UTF-8 columns
+- Rewrites image_path / thumb_path to keys relative to data/processed
+  (images/15970.jpg), replacing absolute paths from the machine that built them
+Outputs:
+- data/processed/metadata_clean.cols/
+- data/processed/embeddings_index.cols/
+
+preprocess_dataset.py and extract_embeddings.py write these tables
+themselves; this script upgrades outputs built before they did.
+
+Usage (from project root):
+    python3 data/scripts/build_columnar.py
+"""
+
+import sys
+import pandas as pd
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+PROCESSED = ROOT / "processed"
+METADATA_CLEAN = PROCESSED / "metadata_clean.csv"
+IDX_CSV = PROCESSED / "embeddings_index.csv"
+PATH_COLUMNS = ("image_path", "thumb_path")
+
+# the table format lives in the API package so build and serve share one implementation
+sys.path.insert(0, str(ROOT.parent / "backend" / "fastapi-ai"))
+from app.utils import columnar  # noqa: E402
+
+
+def relative_key(path: str) -> str:
+    """'/Users/x/data/processed/images/1.jpg' or 'data/processed/images/1.jpg' -> 'images/1.jpg'"""
+    if not path:
+        return ""
+    p = Path(path)
+    return f"{p.parent.name}/{p.name}" if p.parent.name else p.name
+
+
+def convert(csv_path: Path, string_columns):
+    df = pd.read_csv(csv_path, dtype=str, on_bad_lines="skip").fillna("")
+    for col in PATH_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].map(relative_key)
+    out = csv_path.with_suffix(".cols")
+    columnar.write_table(df, str(out), string_columns=string_columns)
+    schema = columnar.read_schema(str(out))
+    kinds = ", ".join(f"{c['name']}:{c['kind']}" for c in schema["columns"])
+    print(f"Saved: {out} ({schema['rows']} rows; {kinds})")
+
+
+if __name__ == "__main__":
+    convert(METADATA_CLEAN, string_columns=("id",) + PATH_COLUMNS)
+    convert(IDX_CSV, string_columns=("id",) + PATH_COLUMNS)
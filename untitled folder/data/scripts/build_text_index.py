@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+build_text_index.py
+- Loads metadata_clean.csv and fits the TF-IDF vectorizer used by /by-quiz
+- Saves vocabulary, idf weights and the CSR matrix in one sparse .npz,
+  tagged with a hash of the metadata file so the API can tell when it is stale
+Outputs:
+- data/processed/tfidf_index.npz
+
+The API loads this artifact at startup instead of refitting; if the metadata
+changed since it was built, the API rebuilds it once and rewrites the file.
+
+Usage (from project root):
+    python3 data/scripts/build_text_index.py
+"""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# reuse the API loader so build and serve agree on columns, params and format
+sys.path.insert(0, str(ROOT.parent / "backend" / "fastapi-ai"))
+from app.utils import loader  # noqa: E402
+
+if __name__ == "__main__":
+    metadata_df = loader.load_metadata()
+    vectorizer, tfidf = loader.build_text_matrix(metadata_df)
+    loader.save_text_matrix(vectorizer, tfidf, loader.metadata_content_hash())
+    print("Saved:", loader._resolve(loader.TFIDF_FNAME), "shape", tfidf.shape)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+evaluate_ann_backends.py
+- Loads embeddings.npy and builds every requested NN backend in memory
+- Also evaluates cluster-routed search over kmeans_model.pkl (CLUSTER_NPROBE)
+- Samples catalog items as queries and measures recall@k against exact
+  brute-force search together with per-query latency
+- Prints a table and writes the numbers to data/processed/ann_report.json
+
+Use it to pick ANN_BACKEND / ANN_NPROBE / ANN_EF_SEARCH for the API.
+
+Usage (from project root):
+    python3 data/scripts/evaluate_ann_backends.py --queries 500 --nprobe 4 8 16
+"""
+
+import argparse
+import json
+import sys
+import joblib
+import numpy as np
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+PROCESSED = ROOT / "processed"
+EMB_PATH = PROCESSED / "embeddings.npy"
+KMEANS_PATH = PROCESSED / "kmeans_model.pkl"
+REPORT_PATH = PROCESSED / "ann_report.json"
+
+sys.path.insert(0, str(ROOT.parent / "backend" / "fastapi-ai"))
+from app.services import ann_index  # noqa: E402
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Recall@k vs latency report for NN backends")
+    p.add_argument("--queries", type=int, default=500, help="number of sampled query items")
+    p.add_argument("--ks", nargs="+", type=int, default=[1, 10, 50])
+    p.add_argument("--nlist", type=int, default=256)
+    p.add_argument("--nprobe", nargs="+", type=int, default=[1, 4, 8, 16, 32])
+    p.add_argument("--ef-search", nargs="+", type=int, default=[16, 64, 128])
+    p.add_argument("--cluster-nprobe", nargs="+", type=int, default=[1, 2, 4, 8])
+    p.add_argument("--skip-hnsw", action="store_true")
+    p.add_argument("--out", default=str(REPORT_PATH))
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    x = ann_index.l2_normalize(np.load(EMB_PATH))
+    rng = np.random.default_rng(0)
+    queries = x[rng.choice(x.shape[0], min(args.queries, x.shape[0]), replace=False)]
+
+    exact = ann_index.BruteForceIndex(x, normalized=True)
+    rows = [ann_index.evaluate(exact, exact, queries, args.ks)]
+
+    ivf = ann_index.IVFIndex.build(x, nlist=args.nlist)
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        rows.append(ann_index.evaluate(ivf, exact, queries, args.ks))
+
+    if KMEANS_PATH.exists():
+        kmeans = joblib.load(KMEANS_PATH)
+        clusters = ann_index.IVFIndex.from_labels(kmeans.cluster_centers_, kmeans.labels_, x, normalized=True)
+        for nprobe in args.cluster_nprobe:
+            clusters.nprobe = nprobe
+            row = ann_index.evaluate(clusters, exact, queries, args.ks)
+            row["backend"] = "kmeans-routed"
+            rows.append(row)
+
+    if not args.skip_hnsw:
+        try:
+            hnsw = ann_index.HNSWIndex.build(x)
+            for ef in args.ef_search:
+                hnsw.ef_search = hnsw.index.hnsw.efSearch = ef
+                rows.append(ann_index.evaluate(hnsw, exact, queries, args.ks))
+        except ImportError as e:
+            print(f"skipping hnsw: {e}")
+
+    print(ann_index.format_report(rows))
+    with open(args.out, "w") as f:
+        json.dump({"n_items": int(x.shape[0]), "dim": int(x.shape[1]), "n_queries": len(queries),
+                   "results": rows}, f, indent=2)
+    print("Saved report:", args.out)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+export_quiz_answers.py
+- Reads the quiz questions defined in the node-api quiz controller
+  (backend/node-api/src/controllers/quizController.js) and writes every answer
+  option (gender, question id, value, text, aesthetic) as JSON
+- The API precomputes the TF-IDF vector and text scores of each option text
+  and aesthetic when it loads its artifacts, so /by-quiz requests made of
+  these answers skip tokenization (see app/services/text_index.AnswerVectors)
+Outputs:
+- data/processed/quiz_answers.json
+
+Rerun after changing the quiz questions; the API picks the file up on its
+next (re)load.
+
+Usage (from project root):
+    python3 data/scripts/export_quiz_answers.py
+"""
+
+import argparse
+import json
+import os
+import re
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+PROCESSED = ROOT / "processed"
+OUT_PATH = PROCESSED / "quiz_answers.json"
+CONTROLLER = ROOT.parent / "backend" / "node-api" / "src" / "controllers" / "quizController.js"
+
+JS_STRING = r'"((?:[^"\\]|\\.)*)"'
+GENDER_RE = re.compile(r"^\s*(female|male)\s*:\s*\[")
+QUESTION_RE = re.compile(r"^\s*id\s*:\s*(\d+)\s*,")
+OPTION_RE = re.compile(r"\{\s*value\s*:\s*" + JS_STRING + r"\s*,\s*text\s*:\s*" + JS_STRING +
+                       r"\s*,\s*aesthetic\s*:\s*" + JS_STRING + r"\s*\}")
+
+
+def js_unescape(s: str) -> str:
+    # the controller only uses JSON-compatible escapes inside double quotes
+    return json.loads(f'"{s}"')
+
+
+def parse_options(source: str):
+    options = []
+    gender, question = None, None
+    for line in source.splitlines():
+        m = GENDER_RE.match(line)
+        if m:
+            gender = m.group(1)
+            continue
+        m = QUESTION_RE.match(line)
+        if m:
+            question = int(m.group(1))
+            continue
+        m = OPTION_RE.search(line)
+        if m and gender is not None:
+            value, text, aesthetic = (js_unescape(g) for g in m.groups())
+            options.append({"gender": gender, "question": question, "value": value,
+                            "text": text, "aesthetic": aesthetic})
+    return options
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Export the quiz answer options for the recommender")
+    p.add_argument("--controller", default=str(CONTROLLER), help="quizController.js to read")
+    p.add_argument("--out", default=str(OUT_PATH))
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with open(args.controller, encoding="utf-8") as f:
+        options = parse_options(f.read())
+    if not options:
+        raise SystemExit(f"No quiz options found in {args.controller}")
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    tmp = args.out + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"source": os.path.relpath(args.controller, ROOT.parent), "options": options},
+                  f, indent=2, ensure_ascii=False)
+    os.replace(tmp, args.out)
+    per_gender = {g: sum(o["gender"] == g for o in options) for g in ("female", "male")}
+    print(f"Saved: {args.out} ({len(options)} options: {per_gender})")
@@ -2,17 +2,40 @@
 """
 extract_embeddings.py
 - Loads processed images and metadata_clean.csv
-- Uses pretrained ResNet50 (no top FC) to extract 2048-d embeddings
-- Saves embeddings as numpy file and a CSV mapping (id -> embedding index)
+- Uses pretrained ResNet50 (no top FC) to extract 2048-d embeddings, through the
+  same extractor the API uses for image queries (app/services/embedding.py)
+- Decodes/resizes images in DataLoader worker processes and runs the model on
+  batches under torch.inference_mode, so CPU-only boxes use every core
+- Keeps an incremental on-disk store of embeddings keyed by (id, image content
+  hash) in checkpointed chunks; reruns only embed new or changed images and
+  a crash loses at most the chunk in progress
+- Compacts the live rows of the store into the serving files:
+  embeddings as numpy file and a CSV mapping (id -> embedding index)
+- Writes a manifest (model, dim, preprocessing, normalization, count) next to
+  embeddings.npy; the API refuses to load embeddings that don't match it
+- Leaves the serving files untouched when no image was embedded or dropped,
+  and otherwise replaces embeddings.npy atomically (temp file + rename)
 Outputs:
+- data/processed/embedding_store/chunk_*.npz
 - data/processed/embeddings.npy
-- data/processed/embeddings_index.csv
+- data/processed/embeddings.manifest.json
+- data/processed/embeddings_index.csv (+ columnar twin embeddings_index.cols/),
+  image paths as keys relative to data/processed
+
+Usage (from project root):
+    python3 data/scripts/extract_embeddings.py --batch-size 64 --workers 4 --threads 8
+    python3 data/scripts/extract_embeddings.py --vacuum   # also drop superseded rows from the store
 """
 
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 import torch
-import torchvision.transforms as T
-from torchvision import models
-from PIL import Image
 import numpy as np
 import pandas as pd
 from pathlib import Path
@@ -23,45 +46,295 @@ PROCESSED = ROOT / "processed"
 METADATA_CLEAN = PROCESSED / "metadata_clean.csv"
 IMAGES_DIR = PROCESSED / "images"
 EMB_PATH = PROCESSED / "embeddings.npy"
+MANIFEST_PATH = PROCESSED / "embeddings.manifest.json"
 IDX_CSV = PROCESSED / "embeddings_index.csv"
+STORE_DIR = PROCESSED / "embedding_store"
+
+# the extractors live in the API package so catalog and query vectors share one implementation
+sys.path.insert(0, str(ROOT.parent / "backend" / "fastapi-ai"))
+from app.services import embedding  # noqa: E402
+from app.utils import columnar  # noqa: E402
+
+
+class ImageDataset(torch.utils.data.Dataset):
+    """Decodes and preprocesses one image per item; failures are flagged, not raised."""
+
+    def __init__(self, image_paths, extractor):
+        self.image_paths = image_paths
+        self.extractor = extractor
+
+    def __len__(self):
+        return len(self.image_paths)
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print("Using device:", device)
-
-# Load data
-df = pd.read_csv(METADATA_CLEAN)
-image_ids = df['id'].tolist()
-
-# Create model
-model = models.resnet50(pretrained=True)
-# remove final fully connected layer
-model = torch.nn.Sequential(*list(model.children())[:-1])
-model.eval().to(device)
-
-transform = T.Compose([
-    T.Resize((224,224)),
-    T.ToTensor(),
-    T.Normalize(mean=[0.485, 0.456, 0.406],
-                std=[0.229, 0.224, 0.225]),
-])
-
-embs = []
-meta_rows = []
-with torch.no_grad():
-    for rid in tqdm(image_ids):
-        img_path = IMAGES_DIR / f"{rid}.jpg"
+    def __getitem__(self, i):
+        ex = self.extractor
         try:
-            im = Image.open(img_path).convert('RGB')
-            x = transform(im).unsqueeze(0).to(device)
-            feat = model(x)  # shape [1, 2048, 1, 1]
-            feat = feat.view(feat.size(0), -1).cpu().numpy()  # [1,2048]
-            embs.append(feat[0])
-            meta_rows.append({'id': rid, 'image_path': str(img_path)})
+            x = ex.preprocess(ex.load_image(self.image_paths[i])[None])[0]
+            return torch.from_numpy(x), i, True
         except Exception as e:
-            print("failed on", img_path, e)
+            print("failed on", self.image_paths[i], e)
+            return torch.zeros(3, *ex.input_size), i, False
+
+
+def _worker_init(_):
+    # decode workers must not each spin up a full set of intra-op threads
+    torch.set_num_threads(1)
+
+
+def embed_images(extractor, image_paths, batch_size=64, workers=4):
+    """
+    Yield (positions, features, batch_len) per batch. positions index into
+    image_paths and only cover images that decoded successfully; features is
+    a float32 (n, dim) array; batch_len counts every image in the batch.
+    """
+    loader = torch.utils.data.DataLoader(
+        ImageDataset(image_paths, extractor),
+        batch_size=batch_size,
+        num_workers=workers,
+        worker_init_fn=_worker_init if workers > 0 else None,
+        pin_memory=extractor.device == "cuda",
+        persistent_workers=False,
+    )
+    for x, pos, ok in loader:
+        batch_len = len(pos)
+        if not ok.any():
+            yield np.empty(0, dtype=np.int64), np.empty((0, extractor.dim), dtype=np.float32), batch_len
+            continue
+        yield pos[ok].numpy(), extractor.forward(x[ok]), batch_len
+
+
+def check_store_model(root: Path, manifest):
+    """The store is only valid for one model; refuse to mix vectors from another."""
+    path = root / "model.json"
+    if path.exists():
+        with open(path) as f:
+            stored = json.load(f)
+        if stored != manifest:
+            raise SystemExit(f"{root} holds {stored.get('model')} embeddings with different settings than "
+                             f"{manifest['model']}; move it away to re-extract from scratch")
+    else:
+        root.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(manifest, f, indent=2)
+
+
+def save_manifest(manifest, count):
+    manifest = {**manifest, "count": count, "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+    tmp = MANIFEST_PATH.with_name(MANIFEST_PATH.name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, MANIFEST_PATH)
+
+
+def save_embeddings(embs):
+    # temp file in the same directory + rename, so the API (or its artifact
+    # watcher) never reads a half-written embeddings.npy
+    tmp = EMB_PATH.with_name(EMB_PATH.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, embs)
+    os.replace(tmp, EMB_PATH)
+
+
+def serving_files_current(manifest, ids):
+    """True if embeddings.npy, its manifest and index already hold exactly `ids` from this model."""
+    if not all(p.exists() for p in (EMB_PATH, MANIFEST_PATH, IDX_CSV, IDX_CSV.with_suffix(".cols"))):
+        return False
+    with open(MANIFEST_PATH) as f:
+        stored = json.load(f)
+    stored.pop("created_at", None)
+    if stored != {**manifest, "count": len(ids)}:
+        return False
+    return pd.read_csv(IDX_CSV, usecols=['id'], dtype=str)['id'].tolist() == ids
+
+
+def file_hash(path):
+    """Content hash of an image file, or None if it cannot be read."""
+    try:
+        with open(path, "rb") as f:
+            return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+    except OSError:
+        return None
+
+
+def hash_images(image_paths, threads=8):
+    with ThreadPoolExecutor(max_workers=threads) as ex:
+        return list(tqdm(ex.map(file_hash, image_paths, chunksize=256), total=len(image_paths),
+                         unit="img", desc="hashing"))
+
+
+class EmbeddingStore:
+    """
+    Append-only directory of chunk_NNNNN.npz files, each holding parallel
+    arrays ids / hashes / embs. A row is identified by (id, image hash), so an
+    image that changed on disk simply gets a new row; old rows are ignored at
+    compaction and removed by vacuum(). Chunks are written to a temp file and
+    renamed, so a crash never leaves a partial chunk behind.
+
+    vacuum() builds the new store in a sibling <root>.vacuum directory and
+    swaps directories by rename (root -> <root>.old, staging -> root), so at
+    any point one complete store exists on disk; opening the store finishes
+    or discards an interrupted vacuum.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._recover_vacuum()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.chunks = []   # list of (ids, hashes, embs)
+        self.keys = {}     # (id, hash) -> (chunk number, row)
+        for path in sorted(self.root.glob("chunk_*.npz")):
+            with np.load(path) as z:
+                self._index(z["ids"], z["hashes"], z["embs"])
+
+    def _staging_dirs(self):
+        return self.root.with_name(self.root.name + ".vacuum"), self.root.with_name(self.root.name + ".old")
+
+    def _recover_vacuum(self):
+        staging, old = self._staging_dirs()
+        if staging.exists():
+            if not self.root.exists():
+                # crashed between the two renames: staging is complete
+                os.replace(staging, self.root)
+                print(f"Finished interrupted vacuum of {self.root}")
+            else:
+                # crashed while staging: the live store was never touched
+                shutil.rmtree(staging)
+        if old.exists():
+            shutil.rmtree(old)
+
+    def _index(self, ids, hashes, embs):
+        c = len(self.chunks)
+        self.chunks.append((ids, hashes, embs))
+        for row, key in enumerate(zip(ids.tolist(), hashes.tolist())):
+            self.keys[key] = (c, row)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add_chunk(self, ids, hashes, embs):
+        ids, hashes = np.asarray(ids, dtype=str), np.asarray(hashes, dtype=str)
+        embs = np.asarray(embs, dtype=np.float32)
+        path = self.root / f"chunk_{len(self.chunks):05d}.npz"
+        tmp = self.root / f"tmp_{path.name}"  # must not match the chunk_*.npz glob
+        np.savez(tmp, ids=ids, hashes=hashes, embs=embs)
+        os.replace(tmp, path)
+        self._index(ids, hashes, embs)
+
+    def get(self, keys):
+        out = np.empty((len(keys), self.chunks[0][2].shape[1] if self.chunks else 0), dtype=np.float32)
+        for i, key in enumerate(keys):
+            c, row = self.keys[key]
+            out[i] = self.chunks[c][2][row]
+        return out
+
+    def vacuum(self, live_keys, chunk_size):
+        """Rewrite the store so it only holds `live_keys`."""
+        live_keys = [k for k in live_keys if k in self.keys]
+        embs = self.get(live_keys)
+        n_old = len(self.chunks)
+        staging, old = self._staging_dirs()
+        if staging.exists():
+            shutil.rmtree(staging)
+        fresh = EmbeddingStore(staging)
+        for start in range(0, len(live_keys), chunk_size):
+            part = live_keys[start:start + chunk_size]
+            fresh.add_chunk([k[0] for k in part], [k[1] for k in part], embs[start:start + chunk_size])
+        for path in self.root.iterdir():
+            if path.is_file() and not path.name.startswith(("chunk_", "tmp_")):
+                shutil.copy2(path, staging / path.name)  # model.json
+        os.replace(self.root, old)
+        os.replace(staging, self.root)
+        shutil.rmtree(old)
+        self.chunks, self.keys = fresh.chunks, fresh.keys
+        print(f"Vacuumed store: {n_old} -> {len(self.chunks)} chunks, {len(self.keys)} rows")
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Extract ResNet50 image embeddings")
+    p.add_argument("--model", default=embedding.DEFAULT_MODEL, choices=sorted(embedding.EXTRACTORS),
+                   help="embedding model (the API serves image queries with the same one)")
+    p.add_argument("--batch-size", type=int, default=64, help="images per forward pass")
+    p.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                   help="DataLoader processes decoding/resizing images (0 = main process)")
+    p.add_argument("--threads", type=int, default=0,
+                   help="torch intra-op threads for inference (0 = torch default)")
+    p.add_argument("--chunk-size", type=int, default=2048, help="embeddings per checkpointed store chunk")
+    p.add_argument("--vacuum", action="store_true", help="drop rows for removed/changed images from the store")
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    extractor = embedding.EXTRACTORS[args.model](device=device)
+    if extractor.framework != "torch":
+        raise SystemExit(f"{args.model} is a {extractor.framework} model; this script batches with torch")
+    manifest = extractor.manifest()
+    print("Model:", args.model, "| device:", device, "| torch threads:", torch.get_num_threads(),
+          "| decode workers:", args.workers, "| batch size:", args.batch_size)
+
+    # Load data
+    df = pd.read_csv(METADATA_CLEAN)
+    image_ids = [str(rid) for rid in df['id'].tolist()]
+    image_paths = [str(IMAGES_DIR / f"{rid}.jpg") for rid in image_ids]
+    hashes = hash_images(image_paths)
+    keys = list(zip(image_ids, hashes))
+
+    store = EmbeddingStore(STORE_DIR)  # opened first: it may finish an interrupted vacuum
+    check_store_model(STORE_DIR, manifest)
+    todo = [i for i, key in enumerate(keys) if key[1] is not None and key not in store]
+    missing = sum(h is None for h in hashes)
+    print(f"Store has {len(store)} rows; {len(todo)} of {len(keys)} images are new or changed"
+          f" ({missing} unreadable)")
+
+    n_done = 0
+    if todo:
+        todo_paths = [image_paths[i] for i in todo]
+        buf_pos, buf_feat = [], []
+        start = time.perf_counter()
+
+        def flush():
+            if buf_pos:
+                pos = np.concatenate(buf_pos)
+                store.add_chunk([image_ids[todo[p]] for p in pos], [hashes[todo[p]] for p in pos],
+                                np.concatenate(buf_feat))
+                buf_pos.clear()
+                buf_feat.clear()
+
+        with tqdm(total=len(todo_paths), unit="img", desc="embedding") as bar:
+            for pos, feat, batch_len in embed_images(extractor, todo_paths, args.batch_size, args.workers):
+                buf_pos.append(pos)
+                buf_feat.append(feat)
+                n_done += len(pos)
+                if sum(len(b) for b in buf_pos) >= args.chunk_size:
+                    flush()
+                bar.update(batch_len)
+                bar.set_postfix(img_per_s=f"{n_done / (time.perf_counter() - start):.1f}")
+            flush()
+        elapsed = time.perf_counter() - start
+        print(f"Embedded {n_done} images in {elapsed:.1f}s ({n_done / max(elapsed, 1e-9):.1f} images/s)")
 
-embs = np.vstack(embs)
-print("emb shape", embs.shape)
-np.save(EMB_PATH, embs)
-pd.DataFrame(meta_rows).to_csv(IDX_CSV, index=False)
-print("Saved:", EMB_PATH, IDX_CSV)
+    # Compact: keep metadata order, drop images that are unreadable or failed to decode
+    live = [i for i, key in enumerate(keys) if key in store]
+    if args.vacuum:
+        store.vacuum([keys[i] for i in live], args.chunk_size)
+    if n_done == 0 and serving_files_current(manifest, [image_ids[i] for i in live]):
+        # nothing embedded, nothing dropped: rewriting would only bump mtimes
+        # and make a watching API reload the same catalog
+        print(f"Serving files are up to date ({len(live)} embeddings); nothing to write")
+        sys.exit(0)
+    embs = store.get([keys[i] for i in live])
+    meta_rows = [{'id': image_ids[i], 'image_path': Path(image_paths[i]).relative_to(PROCESSED).as_posix()}
+                 for i in live]
+    print("emb shape", embs.shape)
+    save_embeddings(embs)
+    save_manifest(manifest, len(embs))
+    idx_df = pd.DataFrame(meta_rows, columns=['id', 'image_path'])
+    idx_df.to_csv(IDX_CSV, index=False)
+    columnar.write_table(idx_df, str(IDX_CSV.with_suffix(".cols")), string_columns=('id', 'image_path'))
+    print("Saved:", EMB_PATH, MANIFEST_PATH, IDX_CSV)
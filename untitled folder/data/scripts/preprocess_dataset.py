@@ -9,14 +9,18 @@ What it does:
 - Resolves image filenames using:
     * an 'image' / 'image_name' column if present,
     * images.csv mapping if present,
-    * or by searching images/ for <id>.<ext> or files that contain the id.
-- Validates images, converts to RGB, resizes to TARGET_SIZE (224x224) and creates THUMBNAILS (128x128).
-- Writes a cleaned metadata CSV with new fields 'image_path' and 'thumb_path'.
+    * or by looking up <id>.<ext> or files that contain the id in an index
+      built from a single scan of images/.
+- Validates images, converts to RGB, resizes to TARGET_SIZE (224x224) and creates THUMBNAILS (128x128),
+  spread over a pool of worker processes (--workers).
+- Writes a cleaned metadata CSV with new fields 'image_path' and 'thumb_path'
+  (keys relative to the output dir, e.g. images/15970.jpg), plus the same table
+  in the columnar format the API memory-maps (metadata_clean.cols/).
 - Writes `bad_rows.csv` logging rows skipped and reasons.
 - Keeps a summarized log printed at the end.
 
 Usage (from project root):
-    python3 data/scripts/preprocess_dataset.py
+    python3 data/scripts/preprocess_dataset.py --workers 8
 
 You can also run with custom paths:
     python3 data/scripts/preprocess_dataset.py --raw data/raw --out data/processed
@@ -24,8 +28,11 @@ You can also run with custom paths:
 """
 
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 import argparse
 import csv
+import os
+import re
 import sys
 import logging
 from PIL import Image, ImageFile
@@ -33,7 +40,10 @@ import pandas as pd
 from tqdm import tqdm
 import shutil
 import traceback
-import glob
+
+# the columnar table format lives in the API package so build and serve share one implementation
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "backend" / "fastapi-ai"))
+from app.utils import columnar  # noqa: E402
 
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
@@ -93,36 +103,102 @@ def build_image_map_from_images_csv(images_csv: Path):
         logging.warning(f"Failed to read images.csv: {e}")
     return mapping
 
-def find_image_file_by_id(images_dir: Path, id_str: str, images_map: dict = None):
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+
+class ImageFileIndex:
+    """
+    One scan of the images directory, answering the lookups that used to be
+    an exists() probe per extension plus a glob over the whole directory per row.
+    Files are indexed by exact name, by stem, and by every digit run in the stem,
+    so a numeric id finds files like 'img_15970_front.jpg' in O(1).
+    """
+
+    def __init__(self, images_dir: Path):
+        self.images_dir = images_dir
+        self.names = set()
+        self.by_token = {}
+        if images_dir.exists():
+            with os.scandir(images_dir) as it:
+                for entry in it:
+                    if entry.is_file():
+                        self._add(entry.name)
+        logging.info(f"Indexed {len(self.names)} files in {images_dir}")
+
+    def _add(self, name: str):
+        self.names.add(name)
+        stem = name.rsplit(".", 1)[0]
+        for token in {stem, *re.findall(r"\d+", stem)}:
+            self.by_token.setdefault(token, []).append(name)
+
+    def path(self, name: str):
+        """images_dir / name if that file exists; name may be a relative path below images_dir."""
+        if name in self.names:
+            return self.images_dir / name
+        # only top-level files are indexed; paths into subdirectories
+        # (e.g. 'front/15970.jpg' from images.csv) are probed directly
+        if "/" in name or os.sep in name:
+            candidate = self.images_dir / name
+            if candidate.is_file():
+                return candidate
+        return None
+
+    def find_by_id(self, id_str: str):
+        # direct name patterns
+        for ext in IMAGE_EXTS:
+            if f"{id_str}{ext}" in self.names:
+                return self.images_dir / f"{id_str}{ext}"
+        # sometimes filenames include prefix/suffix around the id
+        matches = self.by_token.get(id_str)
+        if matches is None and not id_str.isdigit():
+            # non-numeric ids are rare; fall back to a substring scan
+            matches = sorted(n for n in self.names if id_str in n)
+        if matches:
+            # prefer jpg/jpeg/png
+            for m in matches:
+                if m.lower().endswith(IMAGE_EXTS):
+                    return self.images_dir / m
+            return self.images_dir / matches[0]
+        return None
+
+def find_image_file_by_id(images_dir: Path, id_str: str, images_map: dict = None,
+                          file_index: ImageFileIndex = None):
     """
     Try multiple strategies to find an image file for a given id string:
     1) If images_map provided and contains id_str => use that filename
     2) Try <id>.<ext> where ext in jpg,jpeg,png
-    3) Glob search for files that contain the id_str
+    3) Search for files that contain the id_str
     4) Return None if not found
+    Pass a prebuilt `file_index` when resolving many ids; otherwise the
+    directory is scanned on every call.
     """
+    if file_index is None:
+        file_index = ImageFileIndex(images_dir)
+
     if images_map and id_str in images_map and images_map[id_str]:
-        candidate = images_dir / images_map[id_str]
-        if candidate.exists():
+        candidate = file_index.path(str(images_map[id_str]))
+        if candidate is not None:
             return candidate
 
-    # direct name patterns
-    for ext in (".jpg", ".jpeg", ".png", ".webp"):
-        p = images_dir / f"{id_str}{ext}"
-        if p.exists():
-            return p
+    return file_index.find_by_id(id_str)
 
-    # sometimes filenames include prefix/suffix; search for files that contain the id substring
-    pattern1 = str(images_dir / f"*{id_str}*")
-    matches = glob.glob(pattern1)
-    if matches:
-        # prefer jpg/jpeg/png
-        for m in matches:
-            if m.lower().endswith((".jpg", ".jpeg", ".png", ".webp")):
-                return Path(m)
-        return Path(matches[0])
+def process_image(task):
+    """
+    Worker: decode, convert, resize and save one image plus its thumbnail.
+    task = (img_path, proc_path, thumb_path, target_size, thumb_size).
+    Returns None on success or an error string.
+    """
+    img_path, proc_path, thumb_path, target_size, thumb_size = task
+    try:
+        with Image.open(img_path) as im:
+            im = im.convert("RGB")
+            im_proc = im.resize(target_size, Image.LANCZOS)
+            im_proc.save(proc_path, quality=90)
 
-    return None
+            thumb = im.resize(thumb_size, Image.LANCZOS)
+            thumb.save(thumb_path, quality=85)
+        return None
+    except Exception as e_img:
+        return f"image_read_error: {e_img}"
 
 def preprocess(
     raw_dir: Path,
@@ -131,6 +207,7 @@ def preprocess(
     thumb_size=(128,128),
     metadata_filename="styles.csv",
     images_csv_name="images.csv",
+    workers=None,
 ):
     raw_dir = raw_dir.resolve()
     out_dir = out_dir.resolve()
@@ -178,66 +255,74 @@ def preprocess(
     total = len(df)
     logging.info(f"Processing {total} metadata rows...")
 
-    for idx, row in tqdm(df.iterrows(), total=total):
+    # computed once instead of per row
+    possible_image_cols = [c for c in df.columns if "image" in c.lower() or "img" in c.lower() or "file" in c.lower()]
+    file_index = ImageFileIndex(raw_dir / "images")
+
+    # 1) resolve ids and image files (cheap dict lookups, done serially)
+    tasks = []   # (row_dict, process_image task)
+    for row in tqdm(df.to_dict("records"), total=total, desc="resolving"):
         try:
             raw_id = row.get(id_col, "")
             if pd.isna(raw_id) or str(raw_id).strip() == "":
-                bad_rows.append({**row.to_dict(), "__reason": "missing_id"})
+                bad_rows.append({**row, "__reason": "missing_id"})
                 continue
             id_str = str(int(float(raw_id))) if str(raw_id).replace('.','',1).isdigit() else str(raw_id).strip()
 
             # If metadata has explicit image filename column, try to use it
-            possible_image_cols = [c for c in df.columns if "image" in c.lower() or "img" in c.lower() or "file" in c.lower()]
             img_path = None
             for c in possible_image_cols:
                 val = row.get(c)
                 if pd.notna(val) and str(val).strip() != "":
-                    candidate = raw_dir / "images" / str(val)
-                    if candidate.exists():
-                        img_path = candidate
+                    img_path = file_index.path(str(val))
+                    if img_path is not None:
                         break
 
             # otherwise find by id
             if img_path is None:
-                img_path = find_image_file_by_id(raw_dir / "images", id_str, images_map)
+                img_path = find_image_file_by_id(raw_dir / "images", id_str, images_map, file_index)
 
             if img_path is None:
-                bad_rows.append({**row.to_dict(), "__reason": "no_image_found"})
+                bad_rows.append({**row, "__reason": "no_image_found"})
                 continue
 
-            # Open and process image
-            try:
-                with Image.open(img_path) as im:
-                    im = im.convert("RGB")
-                    im_proc = im.resize(target_size, Image.LANCZOS)
-                    proc_filename = f"{id_str}.jpg"
-                    proc_path = processed_images_dir / proc_filename
-                    im_proc.save(proc_path, quality=90)
-
-                    thumb = im.resize(thumb_size, Image.LANCZOS)
-                    thumb_path = thumbs_dir / proc_filename
-                    thumb.save(thumb_path, quality=85)
-
-                    out_row = row.to_dict()
-                    # store relative paths (relative to project root)
-                    out_row['image_path'] = str(proc_path.relative_to(Path.cwd()))
-                    out_row['thumb_path'] = str(thumb_path.relative_to(Path.cwd()))
-                    valid_rows.append(out_row)
-            except Exception as e_img:
-                bad_rows.append({**row.to_dict(), "__reason": f"image_read_error: {e_img}"})
-                continue
+            proc_filename = f"{id_str}.jpg"
+            proc_path = processed_images_dir / proc_filename
+            thumb_path = thumbs_dir / proc_filename
+            tasks.append((row, (str(img_path), str(proc_path), str(thumb_path), tuple(target_size), tuple(thumb_size))))
 
         except Exception as e:
             # catch-all for unexpected errors per-row
             trace = traceback.format_exc()
-            bad_rows.append({**row.to_dict(), "__reason": f"unexpected_error: {e}", "__trace": trace})
+            bad_rows.append({**row, "__reason": f"unexpected_error: {e}", "__trace": trace})
             continue
 
+    # 2) decode / resize / save in a process pool; map() keeps metadata order
+    workers = workers or os.cpu_count() or 1
+    logging.info(f"Processing {len(tasks)} images with {workers} worker processes...")
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        results = ex.map(process_image, [t for _, t in tasks], chunksize=64)
+        for (row, task), error in tqdm(zip(tasks, results), total=len(tasks), desc="images"):
+            if error is not None:
+                bad_rows.append({**row, "__reason": error})
+                continue
+            try:
+                out_row = dict(row)
+                # store keys relative to out_dir, valid on any machine
+                out_row['image_path'] = Path(task[1]).relative_to(out_dir).as_posix()
+                out_row['thumb_path'] = Path(task[2]).relative_to(out_dir).as_posix()
+                valid_rows.append(out_row)
+            except Exception as e:
+                trace = traceback.format_exc()
+                bad_rows.append({**row, "__reason": f"unexpected_error: {e}", "__trace": trace})
+
     # Save cleaned metadata and bad rows
     metadata_clean_csv = out_dir / "metadata_clean.csv"
     bad_rows_csv = out_dir / "bad_rows.csv"
     if valid_rows:
-        pd.DataFrame(valid_rows).to_csv(metadata_clean_csv, index=False)
+        clean_df = pd.DataFrame(valid_rows)
+        clean_df.to_csv(metadata_clean_csv, index=False)
+        columnar.write_table(clean_df, str(out_dir / "metadata_clean.cols"))
         logging.info(f"Saved cleaned metadata: {metadata_clean_csv} ({len(valid_rows)} rows)")
     else:
         logging.warning("No valid rows processed; cleaned metadata not created.")
@@ -266,6 +351,7 @@ def parse_args():
     p.add_argument("--thumb-size", nargs=2, type=int, default=(128,128), help="thumbnail size (W H)")
     p.add_argument("--metadata-filename", default="styles.csv", help="metadata CSV filename in raw dir")
     p.add_argument("--images-csv", default="images.csv", help="images CSV mapping filename (optional)")
+    p.add_argument("--workers", type=int, default=os.cpu_count(), help="processes for image decode/resize/save")
     return p.parse_args()
 
 if __name__ == "__main__":
@@ -283,6 +369,7 @@ if __name__ == "__main__":
         thumb_size=tuple(args.thumb_size),
         metadata_filename=args.metadata_filename,
         images_csv_name=args.images_csv,
+        workers=args.workers,
     )
 
     logging.info("Result summary:")